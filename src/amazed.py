@@ -1,20 +1,51 @@
 import pygame
 import random
 import math
+import argparse
+import heapq
+import atexit
+import csv
+import gc
+import json
+import mmap
 import os
-
-# Initialize Pygame
-pygame.init()
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Benchmarks run headless, so pick the dummy SDL drivers before Pygame starts
+if __name__ == "__main__" and any(arg.startswith('--benchmark') for arg in sys.argv):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
 
 # Fixed screen dimensions
 WIDTH, HEIGHT = 1000, 800
 
 CELL_SIZE = 64 
 PLAYER_SIZE = 60
-FPS = 60
+FPS = 60  # Render cap; the simulation runs at SIM_RATE whatever the frame rate
+SIM_RATE = 60  # Simulation steps per second, speeds below are per step
+MAX_CATCH_UP_STEPS = 5  # Steps per frame before the backlog is dropped and the game slows down
 VISIBILITY_RADIUS = 200
 FADE_RADIUS = 50
-LIGHT_LEVEL = 150  # Base level of light intensity
+
+# Maze render mode: 'tiles' blits every visible cell, 'chunked' blits pre-rendered chunks
+MAZE_RENDER_MODE = 'chunked'
+CHUNK_CELLS = 16  # Chunk edge length in cells
+MAX_CACHED_CHUNKS = 8  # Least recently used chunks beyond this are evicted
 
 BUTTON_PARTICLE_COLORS = [
     (241, 124, 116),  # #f17c74
@@ -28,55 +59,168 @@ BUTTON_PARTICLE_COLORS = [
 
 BLUE = (255, 50, 0)
 
+menu_music_tracks = []  # The menu track has not been shipped yet
 game_music_tracks = [
     os.path.join('assets', 'gamemusic1.mp3'),
-    os.path.join('assets', 'gamemusic2.mp3'),
-    os.path.join('assets', 'gamemusic3.mp3')
+    os.path.join('assets', 'gamemusic2.mp3')
 ]
-current_game_track = None
-
-# Set up the display
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Amazed")
-clock = pygame.time.Clock()
 
-
-# Load wall texture
-wall_texture = pygame.image.load(os.path.join('assets', 'wall.png')).convert_alpha()
-# Load floor texture
-floor_texture = pygame.image.load(os.path.join('assets', 'floor.png')).convert_alpha()
-# Load background image from assets folder
-background_image = pygame.image.load(os.path.join('assets', 'mainmenu.png')).convert()
+# The display and the mixer are opened on first use, not at import, so tools can
+# import this module cheaply and the menu can show before audio is up
+screen = None
+clock = None
+audio_ready = threading.Event()
+
+def init_display():
+    global screen, clock
+    if screen is None:
+        pygame.display.init()
+        pygame.font.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Amazed")
+        clock = pygame.time.Clock()
+    return screen
+
+def init_audio():
+    # Safe to call from the preload thread; without an audio device the game stays silent
+    if not audio_ready.is_set():
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"Error initializing audio: {e}")
+            return
+        pygame.mixer.music.set_volume(VOLUME)
+        audio_ready.set()
+
+class SilentSound:
+    # Stands in for a sound while audio is starting up or unavailable
+    def play(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+SILENT_SOUND = SilentSound()
+
+
+class AssetManager:
+    # Loads every image, scaled image and sound once and hands out shared handles.
+    # preload() starts the mixer and decodes assets on a background thread;
+    # surfaces are converted to the display format on first use from the main thread.
+    def __init__(self, root='assets'):
+        self.root = root
+        self.lock = threading.Lock()
+        self.decoded = {}  # File name -> surface decoded by the preload thread
+        self.converted = set()  # File names already converted on the main thread
+        self.images = {}  # (file name, alpha, size) -> converted surface
+        self.sounds = {}  # File name -> pygame.mixer.Sound
+        self.load_times = {}  # Asset key -> seconds spent loading it
+        self.preload_thread = None
+
+    def image(self, name, alpha=True, size=None):
+        key = (name, alpha, size)
+        surface = self.images.get(key)
+        if surface is None:
+            start = time.perf_counter()
+            with self.lock:
+                surface = self.decoded.pop(name, None)
+                decode_time = self.load_times.get(name, 0.0)
+            if surface is None:
+                surface = pygame.image.load(os.path.join(self.root, name))
+            surface = surface.convert_alpha() if alpha else surface.convert()
+            if size is not None:
+                surface = pygame.transform.scale(surface, size)
+            self.images[key] = surface
+            self.converted.add(name)
+            self.load_times[key] = decode_time + time.perf_counter() - start
+        return surface
+
+    def sound(self, name):
+        sound = self.sounds.get(name)
+        if sound is None:
+            if not audio_ready.is_set():
+                return SILENT_SOUND
+            sound = self.load_sound(name)
+        return sound
+
+    def load_sound(self, name):
+        start = time.perf_counter()
+        sound = pygame.mixer.Sound(os.path.join(self.root, name))
+        sound.set_volume(VOLUME)
+        with self.lock:
+            if name not in self.sounds:
+                self.sounds[name] = sound
+                self.load_times[name] = time.perf_counter() - start
+            return self.sounds[name]
+
+    def all_sounds(self):
+        with self.lock:
+            return list(self.sounds.values())
+
+    def preload(self, images=(), sounds=()):
+        if self.preload_thread is None:
+            self.preload_thread = threading.Thread(target=self.preload_worker, args=(images, sounds), daemon=True)
+            self.preload_thread.start()
+
+    def preload_worker(self, images, sounds):
+        init_audio()
+        if audio_ready.is_set():
+            for name in sounds:
+                if name not in self.sounds:
+                    self.load_sound(name)
+        for name in images:
+            if name not in self.converted and name not in self.decoded:
+                start = time.perf_counter()
+                surface = pygame.image.load(os.path.join(self.root, name))
+                with self.lock:
+                    self.decoded[name] = surface
+                    self.load_times[name] = time.perf_counter() - start
+
+    def wait(self):
+        if self.preload_thread is not None:
+            self.preload_thread.join()
+
+    def report(self):
+        # (asset, kind, load ms, resident bytes) for everything loaded so far
+        rows = []
+        for (name, alpha, size), surface in self.images.items():
+            label = name if size is None else f"{name} @{size[0]}x{size[1]}"
+            rows.append((label, 'image', self.load_times.get((name, alpha, size), 0.0) * 1000, surface.get_pitch() * surface.get_height()))
+        with self.lock:
+            decoded = list(self.decoded.items())
+        for name, surface in decoded:
+            # Preloaded but not used yet
+            rows.append((f"{name} (decoded)", 'image', self.load_times.get(name, 0.0) * 1000,
+                         surface.get_pitch() * surface.get_height()))
+        for name, sound in self.sounds.items():
+            rows.append((name, 'sound', self.load_times.get(name, 0.0) * 1000, len(sound.get_raw())))
+        return rows
+
+PLAYER_SPRITE_FILES = [os.path.join('player', f'player_{direction}_{frame}.png')
+                       for direction in ('down', 'up', 'left', 'right') for frame in (1, 2, 3)]
+
+# Loaded in the background while the main menu shows its first frames
+PRELOAD_IMAGES = ['wall.png', 'floor.png', 'optionmenu.png'] + PLAYER_SPRITE_FILES
+PRELOAD_SOUNDS = ['hover.wav', 'select.wav', 'hover2.wav', 'select2.wav', 'back.wav']
 
 VOLUME = 1.0  # 1.0 is full volume, 0.0 is muted
-all_sounds = []
-
-hover_sound = pygame.mixer.Sound(os.path.join('assets', 'hover.wav'))
-hover2_sound = pygame.mixer.Sound(os.path.join('assets', 'hover2.wav'))
-select_sound = pygame.mixer.Sound(os.path.join('assets', 'select.wav'))
-select2_sound = pygame.mixer.Sound(os.path.join('assets', 'select2.wav'))
-pygame.mixer.music.load(os.path.join('assets', 'music1.wav'))
-back_sound = pygame.mixer.Sound(os.path.join('assets', 'back.wav'))
-all_sounds.append(back_sound)
-back_sound.set_volume(VOLUME)
-
-
-# Add all sounds to the global list
-all_sounds.extend([hover_sound, hover2_sound, select_sound, select2_sound])
-
-# Set initial volume for all sounds
-for sound in all_sounds:
-    sound.set_volume(VOLUME)
-
+assets = AssetManager()
 
 
-# Create a fog surface
-fog_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+# Fog masks are cached on disk and light maps in memory, keyed by fog_cache_key()
+FOG_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'amazed')
+fog_cache = {}
 
 class Player:
     def __init__(self, x, y):
         self.x = x
         self.y = y
+        # Position before the last simulation step, and the interpolated one to draw at
+        self.previous_x, self.previous_y = x, y
+        self.render_x, self.render_y = x, y
         self.speed = 3
         self.animation_frame = 0
         self.animation_speed = 0.1
@@ -102,63 +246,29 @@ class Player:
 
     def load_sprites(self):
         try:
+            # Shared, already scaled frames from the asset manager
             self.sprites = {
-                'down': [
-                    pygame.image.load(os.path.join('assets', 'player', 'player_down_1.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_down_2.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_down_3.png')).convert_alpha()
-                ],
-                'up': [
-                    pygame.image.load(os.path.join('assets', 'player', 'player_up_1.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_up_2.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_up_3.png')).convert_alpha()
-                ],
-                'left': [
-                    pygame.image.load(os.path.join('assets', 'player', 'player_left_1.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_left_2.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_left_3.png')).convert_alpha()
-                ],
-                'right': [
-                    pygame.image.load(os.path.join('assets', 'player', 'player_right_1.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_right_2.png')).convert_alpha(),
-                    pygame.image.load(os.path.join('assets', 'player', 'player_right_3.png')).convert_alpha()
-                ]
+                direction: [assets.image(os.path.join('player', f'player_{direction}_{frame}.png'), size=(PLAYER_SIZE, PLAYER_SIZE))
+                            for frame in (1, 2, 3)]
+                for direction in ('down', 'up', 'left', 'right')
             }
-            # Resize sprites if necessary
-            for key in self.sprites:
-                self.sprites[key] = [pygame.transform.scale(img, (PLAYER_SIZE, PLAYER_SIZE)) for img in self.sprites[key]]
         except Exception as e:
             print(f"Error loading sprites: {e}")
             raise
 
     def move(self, keys, maze):
+        # One simulation step
+        self.previous_x, self.previous_y = self.x, self.y
         dx = (keys[controls['right']] - keys[controls['left']]) * self.speed
         dy = (keys[controls['down']] - keys[controls['up']]) * self.speed
    
-        new_x = self.x + dx
-        new_y = self.y + dy
-
-        # Update collision border position
-        new_collision_border = pygame.Rect(
-            new_x + self.collision_offset_x,
-            new_y + self.collision_offset_y,
-            self.collision_width,
-            self.collision_height
-        )
-
-        # Check horizontal movement
-        if not any(maze.is_wall(new_collision_border.left, y) or 
-                maze.is_wall(new_collision_border.right - 1, y) 
-                for y in range(new_collision_border.top, new_collision_border.bottom, 5)):
-            self.x = new_x
-            self.collision_border.x = new_collision_border.x
-
-        # Check vertical movement
-        if not any(maze.is_wall(x, new_collision_border.top) or 
-                maze.is_wall(x, new_collision_border.bottom - 1) 
-                for x in range(new_collision_border.left, new_collision_border.right, 5)):
-            self.y = new_y
-            self.collision_border.y = new_collision_border.y
+        # Slide the collision box through the tile grid, stopping flush against walls
+        left, top = sweep_box(maze, self.x + self.collision_offset_x, self.y + self.collision_offset_y,
+                              self.collision_width, self.collision_height, dx, dy)
+        self.x = left - self.collision_offset_x
+        self.y = top - self.collision_offset_y
+        self.collision_border.x = left
+        self.collision_border.y = top
 
         # Update animation and direction
         if dx > 0:
@@ -177,19 +287,35 @@ class Player:
         else:
             self.animation_frame = 0
 
-    def draw(self, camera_x, camera_y):
-        try:
-            current_sprite = self.sprites[self.direction][int(self.animation_frame)]
+    def interpolate(self, alpha):
+        # Draw alpha of the way from the previous step to the current one, on whole pixels
+        self.render_x = round(self.previous_x + (self.x - self.previous_x) * alpha)
+        self.render_y = round(self.previous_y + (self.y - self.previous_y) * alpha)
+
+    def center_cell(self):
+        # Cell under the middle of the player, which is where the light is centered
+        return int((self.x + PLAYER_SIZE // 2) // CELL_SIZE), int((self.y + PLAYER_SIZE // 2) // CELL_SIZE)
+
+    def sprite_rect(self, camera_x, camera_y):
+        # Add a manual offset here
+        sprite_offset_x = -15  # Adjust this value to move the sprite left or right
+        sprite_offset_y = -15    # You can also adjust this if you want to move it up or down
 
-            # Add a manual offset here
-            sprite_offset_x = -15  # Adjust this value to move the sprite left or right
-            sprite_offset_y = -15    # You can also adjust this if you want to move it up or down
+        return pygame.Rect(self.render_x - camera_x + sprite_offset_x, self.render_y - camera_y + sprite_offset_y, PLAYER_SIZE, PLAYER_SIZE)
 
-            sprite_x = self.x - camera_x + sprite_offset_x
-            sprite_y = self.y - camera_y + sprite_offset_y
+    def sprite(self, size=PLAYER_SIZE):
+        if size == PLAYER_SIZE:
+            return self.sprites[self.direction][int(self.animation_frame)]
+        return assets.image(os.path.join('player', f'player_{self.direction}_{int(self.animation_frame) + 1}.png'), size=(size, size))
+
+    def draw(self, camera_x, camera_y, view=None):
+        view = view or scene_view(1.0)
+        try:
+            current_sprite = self.sprite(view.to_view(PLAYER_SIZE))
 
             # Draw the sprite
-            screen.blit(current_sprite, (sprite_x, sprite_y))
+            rect = self.sprite_rect(camera_x, camera_y)
+            view.surface.blit(current_sprite, (view.to_view(rect.x), view.to_view(rect.y)))
 
             # Draw the collision border
             # pygame.draw.rect(screen, self.collision_border_color, 
@@ -213,178 +339,1591 @@ def resize_collision_box(self, new_width):
         self.collision_height
     )
     
+def overlapped_cells(low, high):
+    # Cells covered by the half-open pixel span [low, high)
+    return math.floor(low / CELL_SIZE), math.ceil(high / CELL_SIZE) - 1
+
+def sweep_axis(maze, position, size, cross_low, cross_high, delta, horizontal):
+    # Moves one edge of a box along an axis, testing only the tile columns (or rows)
+    # the leading edge enters. Returns the new position of the box's low edge.
+    first_cross, last_cross = overlapped_cells(cross_low, cross_high)
+
+    def blocked(line):
+        if horizontal:
+            return any(maze.is_wall_cell(line, cross) for cross in range(first_cross, last_cross + 1))
+        return any(maze.is_wall_cell(cross, line) for cross in range(first_cross, last_cross + 1))
+
+    if delta > 0:
+        entered_first = overlapped_cells(position, position + size)[1] + 1
+        entered_last = overlapped_cells(position, position + size + delta)[1]
+        for line in range(entered_first, entered_last + 1):
+            if blocked(line):
+                return line * CELL_SIZE - size
+    else:
+        entered_first = overlapped_cells(position, position + size)[0] - 1
+        entered_last = overlapped_cells(position + delta, position + size)[0]
+        for line in range(entered_first, entered_last - 1, -1):
+            if blocked(line):
+                return (line + 1) * CELL_SIZE
+    return position + delta
+
+def sweep_box(maze, left, top, width, height, dx, dy):
+    # Resolve x then y so a blocked axis slides along the wall on the other
+    if dx:
+        left = sweep_axis(maze, left, width, top, top + height, dx, True)
+    if dy:
+        top = sweep_axis(maze, top, height, left, left + width, dy, False)
+    return left, top
+
+def sample_collision_move(maze, left, top, width, height, dx, dy):
+    # The previous collision check, kept as a reference for benchmark_collision():
+    # samples the box edges every 5 pixels and rejects a blocked axis outright
+    new_left, new_top = left + dx, top + dy
+    if not any(maze.is_wall(new_left, y) or maze.is_wall(new_left + width - 1, y)
+               for y in range(new_top, new_top + height, 5)):
+        left = new_left
+    if not any(maze.is_wall(x, new_top) or maze.is_wall(x, new_top + height - 1)
+               for x in range(new_left, new_left + width, 5)):
+        top = new_top
+    return left, top
+
+def box_hits_wall(maze, left, top, width, height):
+    first_x, last_x = overlapped_cells(left, left + width)
+    first_y, last_y = overlapped_cells(top, top + height)
+    return any(maze.is_wall_cell(x, y) for y in range(first_y, last_y + 1) for x in range(first_x, last_x + 1))
+
+def benchmark_collision(moves=20000, seed=1):
+    rng = random.Random(seed)
+    maze = Maze(25, 25, seed=seed)
+    width, height = PLAYER_SIZE // 2, PLAYER_SIZE - 15
+
+    # Random open starting boxes and moves, including speeds far above the default
+    cases = []
+    while len(cases) < moves:
+        left = rng.randrange(CELL_SIZE, (maze.width - 1) * CELL_SIZE)
+        top = rng.randrange(CELL_SIZE, (maze.height - 1) * CELL_SIZE)
+        if not box_hits_wall(maze, left, top, width, height):
+            speed = rng.choice((3, 3, 3, 8, 20, 70))
+            cases.append((left, top, rng.randint(-1, 1) * speed, rng.randint(-1, 1) * speed))
+
+    for name, resolve in (('sampled', sample_collision_move), ('swept', sweep_box)):
+        start = time.perf_counter()
+        for left, top, dx, dy in cases:
+            resolve(maze, left, top, width, height, dx, dy)
+        elapsed = time.perf_counter() - start
+        print(f"collision {name:>7}: {elapsed / moves * 1e6:7.2f} us/move")
+
+    # Property check: the swept resolver never ends inside a wall, and on straight moves
+    # it gets at least as far as the sampler whenever the sampler stayed out of walls.
+    # Diagonals differ on purpose: the sampler tested x at the new y, which cut corners.
+    sampler_misses = 0
+    failures = 0
+    for left, top, dx, dy in cases:
+        new_left, new_top = sweep_box(maze, left, top, width, height, dx, dy)
+        old_left, old_top = sample_collision_move(maze, left, top, width, height, dx, dy)
+        if box_hits_wall(maze, new_left, new_top, width, height):
+            failures += 1
+        if box_hits_wall(maze, old_left, old_top, width, height):
+            sampler_misses += 1
+        elif (dx == 0 or dy == 0) and (abs(new_left - left) < abs(old_left - left) or abs(new_top - top) < abs(old_top - top)):
+            failures += 1
+    print(f"collision property: {failures} failures, sampler ended inside walls {sampler_misses} times")
+    return 1 if failures else 0  # For sys.exit()
+
+class FixedTimestep:
+    # Turns real frame times into a whole number of SIM_RATE simulation steps
+    def __init__(self, rate=SIM_RATE, max_steps=MAX_CATCH_UP_STEPS):
+        self.step_time = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.dropped = 0.0  # Seconds of simulation skipped to stay responsive
+
+    def advance(self, elapsed):
+        # Returns the number of steps to run for elapsed seconds of real time
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step_time)
+        if steps > self.max_steps:
+            # Catching up fully would make the next frame slower still
+            self.dropped += (steps - self.max_steps) * self.step_time
+            steps = self.max_steps
+            self.accumulator %= self.step_time
+        else:
+            self.accumulator -= steps * self.step_time
+        return steps
+
+    def alpha(self):
+        # How far real time is between the last step and the next one
+        return self.accumulator / self.step_time
+
+def benchmark_timestep(seconds=5, headless_steps=60000, seed=1):
+    # Walks the same route at different render rates on a virtual clock; movement
+    # speed should not depend on the frame rate until catch-up runs out. Returns 1 if
+    # any rate ends somewhere else than the same steps taken directly, for sys.exit()
+    maze = Maze(101, 101, seed=seed)
+    failed = False
+    start = CELL_SIZE + CELL_SIZE // 2 - PLAYER_SIZE // 2
+    directions = [HeldKeys(controls['right']), HeldKeys(controls['down']), HeldKeys(controls['left']), HeldKeys(controls['up'])]
+
+    def step(player, tick):
+        player.move(directions[tick // 40 % len(directions)], maze)
+
+    for fps in (144, 60, 30, 10):
+        player = Player(start, start)
+        timestep = FixedTimestep()
+        ticks = 0
+        for _ in range(int(seconds * fps)):
+            for _ in range(timestep.advance(1 / fps)):
+                step(player, ticks)
+                ticks += 1
+            player.interpolate(timestep.alpha())
+
+        reference = Player(start, start)
+        for tick in range(ticks):
+            step(reference, tick)
+        same = (player.x, player.y) == (reference.x, reference.y)
+        failed = failed or not same
+        print(f"timestep {fps:4d} fps: {ticks / seconds:6.1f} steps per second   "
+              f"dropped {timestep.dropped:5.2f} s   {'ok' if same else 'MISMATCH'}")
+
+    player = Player(start, start)
+    begin = time.perf_counter()
+    for tick in range(headless_steps):
+        step(player, tick)
+    elapsed = time.perf_counter() - begin
+    print(f"timestep headless: {headless_steps / elapsed:,.0f} steps per second "
+          f"({headless_steps / SIM_RATE / elapsed:.0f}x real time)")
+    return 1 if failed else 0
+
+# Internal render resolution of the game scene, as a fraction of the window size.
+# Below 1.0 the scene is drawn offscreen and upscaled to the screen once per frame.
+# Only half scale is offered: the 2x upscale is cheap, while a non-integer one such
+# as 75% costs more than drawing the smaller scene saves.
+RENDER_QUALITY_PRESETS = [('Low', 0.5), ('High', 1.0)]
+RENDER_SCALE = 1.0
+
+class SceneView:
+    def __init__(self, scale):
+        self.scale = scale
+        self.width = round(WIDTH * scale)
+        self.height = round(HEIGHT * scale)
+        self.cell_size = round(CELL_SIZE * scale)
+        self.offscreen = None if scale == 1 else pygame.Surface((self.width, self.height)).convert()
+
+    @property
+    def surface(self):
+        return screen if self.offscreen is None else self.offscreen
+
+    def to_view(self, value):
+        return round(value * self.scale)
+
+    def rect_to_view(self, rect):
+        # Smallest view rect covering a screen rect
+        if self.offscreen is None:
+            return rect
+        left, top = math.floor(rect.left * self.scale), math.floor(rect.top * self.scale)
+        right, bottom = math.ceil(rect.right * self.scale), math.ceil(rect.bottom * self.scale)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def present(self):
+        # Upscales the finished scene onto the screen
+        if self.offscreen is not None:
+            pygame.transform.scale(self.offscreen, (WIDTH, HEIGHT), screen)
+
+scene_views = {}
+
+def render_quality_name():
+    for name, scale in RENDER_QUALITY_PRESETS:
+        if scale == RENDER_SCALE:
+            return name
+    return 'Custom'
+
+def scene_view(scale=None):
+    scale = RENDER_SCALE if scale is None else scale
+    view = scene_views.get(scale)
+    if view is None:
+        view = scene_views[scale] = SceneView(scale)
+    return view
+
+def tile_texture(name, cell_size):
+    if cell_size == CELL_SIZE:
+        return assets.image(name)
+    return assets.image(name, size=(cell_size, cell_size))
+
 class Maze:
-    def __init__(self, width, height):
+    def __init__(self, width, height, generator='backtracker', seed=None):
         self.width = width
         self.height = height
-        self.grid = [[1 for _ in range(width)] for _ in range(height)]
+        self.generator = generator
+        # Always record a seed so the same maze can be generated again
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        # One byte per cell in a flat buffer; grid[y][x] rows are views into it
+        self.cells = bytearray(b'\x01' * (width * height))
+        self.grid = [memoryview(self.cells)[y * width:(y + 1) * width] for y in range(height)]
+        self.chunks = OrderedDict()
+        self.chunk_cell_size = CELL_SIZE
+        self.distance_field = None  # Built on first use by exit_distances()
         self.generate()
         self.set_exit()
 
     def generate(self):
+        width, height, cells = self.width, self.height, self.cells
+
         # Create border
-        for x in range(self.width):
-            self.grid[0][x] = 1
-            self.grid[self.height-1][x] = 1
-        for y in range(self.height):
-            self.grid[y][0] = 1
-            self.grid[y][self.width-1] = 1
+        cells[0:width] = b'\x01' * width
+        cells[(height - 1) * width:height * width] = b'\x01' * width
+        for y in range(height):
+            cells[y * width] = 1
+            cells[y * width + width - 1] = 1
 
         # Generate maze inside border
-        stack = [(1, 1)]
-        self.grid[1][1] = 0
-
-        while stack:
-            x, y = stack[-1]
-            neighbors = [(x+2, y), (x-2, y), (x, y+2), (x, y-2)]
-            valid_neighbors = [(nx, ny) for nx, ny in neighbors if 0 < nx < self.width-1 and 0 < ny < self.height-1 and self.grid[ny][nx] == 1]
-
-            if valid_neighbors:
-                nx, ny = random.choice(valid_neighbors)
-                self.grid[ny][nx] = 0
-                self.grid[(y + ny) // 2][(x + nx) // 2] = 0
-                stack.append((nx, ny))
-            else:
-                stack.pop()
+        MAZE_GENERATORS[self.generator](cells, width, height, random.Random(self.seed))
 
     def set_exit(self):
         self.exit = (self.width - 2, self.height - 2)
         self.grid[self.exit[1]][self.exit[0]] = 2
 
     def is_wall(self, x, y):
-        cell_x = int(x // CELL_SIZE)
-        cell_y = int(y // CELL_SIZE)
-        return cell_x < 0 or cell_x >= self.width or cell_y < 0 or cell_y >= self.height or self.grid[cell_y][cell_x] == 1
+        return self.is_wall_cell(int(x // CELL_SIZE), int(y // CELL_SIZE))
+
+    def is_wall_cell(self, cell_x, cell_y):
+        return cell_x < 0 or cell_x >= self.width or cell_y < 0 or cell_y >= self.height or self.cells[cell_y * self.width + cell_x] == 1
+
+    def pack_walls(self):
+        return PackedWalls(self.cells, self.width, self.height)
+
+    def exit_distances(self):
+        if self.distance_field is None:
+            self.distance_field = ExitDistanceField(self)
+        return self.distance_field
+
+    def set_cell(self, x, y, value):
+        # Edits one cell and keeps everything derived from the grid in step
+        if x <= 0 or y <= 0 or x >= self.width - 1 or y >= self.height - 1:
+            raise ValueError(f"cell ({x}, {y}) is on the border, which is always wall")
+        self.cells[y * self.width + x] = value
+        self.invalidate_cell(x, y)
+        if self.distance_field is not None:
+            self.distance_field.cell_changed(x, y)
+
+    def close(self):
+        # Nothing to release; MappedMaze unmaps its file
+        pass
+
+    def visible_cells(self, camera_x, camera_y, view):
+        # Cell range (end exclusive) overlapping the view, clamped to the grid
+        cell_size = view.cell_size
+        return self.clamp_cells(camera_x // cell_size, camera_y // cell_size,
+                                (camera_x + view.width - 1) // cell_size + 1, (camera_y + view.height - 1) // cell_size + 1)
+
+    def clamp_cells(self, first_x, first_y, last_x, last_y):
+        return max(0, first_x), max(0, first_y), min(self.width, last_x), min(self.height, last_y)
+
+    def cell_row(self, y, first_x, last_x):
+        return self.grid[y][first_x:last_x]
+
+    def draw(self, camera_x, camera_y, view=None):
+        # The camera is in world pixels, the view decides the surface and the cell size
+        view = view or scene_view(1.0)
+        camera_x, camera_y = view.to_view(int(camera_x)), view.to_view(int(camera_y))
+        view.surface.fill((0, 0, 0))  # Fill the screen with black
+        if MAZE_RENDER_MODE == 'chunked':
+            self.draw_chunks(camera_x, camera_y, view)
+        else:
+            self.draw_tiles(camera_x, camera_y, view)
+
+    def draw_tiles(self, camera_x, camera_y, view):
+        cell_size = view.cell_size
+        wall_texture = tile_texture('wall.png', cell_size)
+        floor_texture = tile_texture('floor.png', cell_size)
+        first_x, first_y, last_x, last_y = self.visible_cells(camera_x, camera_y, view)
+        surface = view.surface
+        tiles = []
+        for y in range(first_y, last_y):
+            screen_y = y * cell_size - camera_y
+            for x, cell in enumerate(self.cell_row(y, first_x, last_x), first_x):
+                screen_x = x * cell_size - camera_x
+                if cell == 1:
+                    tiles.append((wall_texture, (screen_x, screen_y)))
+                elif cell == 2:
+                    pygame.draw.rect(surface, BLUE, (screen_x, screen_y, cell_size, cell_size))
+                elif cell == 0:
+                    tiles.append((floor_texture, (screen_x, screen_y)))
+        surface.blits(tiles, doreturn=False)
+
+    def draw_chunks(self, camera_x, camera_y, view):
+        first_x, first_y, last_x, last_y = self.visible_cells(camera_x, camera_y, view)
+        if first_x >= last_x or first_y >= last_y:
+            return
+        chunk_pixels = CHUNK_CELLS * view.cell_size
+        for chunk_y in range(first_y // CHUNK_CELLS, (last_y - 1) // CHUNK_CELLS + 1):
+            for chunk_x in range(first_x // CHUNK_CELLS, (last_x - 1) // CHUNK_CELLS + 1):
+                view.surface.blit(self.chunk_surface(chunk_x, chunk_y, view.cell_size),
+                                  (chunk_x * chunk_pixels - camera_x, chunk_y * chunk_pixels - camera_y))
+
+    def chunk_surface(self, chunk_x, chunk_y, cell_size=CELL_SIZE):
+        if cell_size != self.chunk_cell_size:
+            # Render quality changed, chunks baked at the old cell size are no use
+            self.chunks.clear()
+            self.chunk_cell_size = cell_size
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.bake_chunk(chunk_x, chunk_y, cell_size)
+            self.chunks[key] = chunk
+            if len(self.chunks) > MAX_CACHED_CHUNKS:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def bake_chunk(self, chunk_x, chunk_y, cell_size=CELL_SIZE):
+        first_x, first_y, last_x, last_y = self.clamp_cells(
+            chunk_x * CHUNK_CELLS, chunk_y * CHUNK_CELLS,
+            (chunk_x + 1) * CHUNK_CELLS, (chunk_y + 1) * CHUNK_CELLS)
+
+        chunk = pygame.Surface(((last_x - first_x) * cell_size, (last_y - first_y) * cell_size)).convert()
+        wall_texture = tile_texture('wall.png', cell_size)
+        floor_texture = tile_texture('floor.png', cell_size)
+        tiles = []
+        for y in range(first_y, last_y):
+            chunk_y_px = (y - first_y) * cell_size
+            for x, cell in enumerate(self.cell_row(y, first_x, last_x), first_x):
+                chunk_x_px = (x - first_x) * cell_size
+                if cell == 1:
+                    tiles.append((wall_texture, (chunk_x_px, chunk_y_px)))
+                elif cell == 2:
+                    chunk.fill(BLUE, (chunk_x_px, chunk_y_px, cell_size, cell_size))
+                elif cell == 0:
+                    tiles.append((floor_texture, (chunk_x_px, chunk_y_px)))
+        chunk.blits(tiles, doreturn=False)
+        return chunk
+
+    def invalidate_cell(self, x, y):
+        # Call after editing self.grid so the baked chunk is rebuilt
+        self.chunks.pop((x // CHUNK_CELLS, y // CHUNK_CELLS), None)
+
+# Endless mode: an unbounded maze stitched together from seeded chunks
+ENDLESS_MODE = False
+LEVEL_PATH = None  # Saved maze to play instead of a freshly generated one
+WORLD_CHUNK_CELLS = 32  # Must be even so rooms stay on odd world coordinates
+WORLD_MAX_CHUNKS = 64  # Memory cap, least recently used chunks are regenerated on demand
+
+class InfiniteMaze(Maze):
+    def __init__(self, generator='backtracker', seed=None, max_chunks=WORLD_MAX_CHUNKS):
+        self.width = None  # Unbounded in both directions
+        self.height = None
+        self.generator = generator
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.max_chunks = max_chunks
+        self.world_chunks = OrderedDict()
+        self.chunks = OrderedDict()  # Rendered chunks, as in Maze
+        self.chunk_cell_size = CELL_SIZE
+        self.exit = None  # Endless, there is nothing to reach
+
+    def world_chunk(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        cells = self.world_chunks.get(key)
+        if cells is None:
+            cells = self.generate_chunk(chunk_x, chunk_y)
+            self.world_chunks[key] = cells
+            if len(self.world_chunks) > self.max_chunks:
+                self.world_chunks.popitem(last=False)
+        else:
+            self.world_chunks.move_to_end(key)
+        return cells
+
+    def generate_chunk(self, chunk_x, chunk_y):
+        # A bordered maze one cell larger than the chunk; its right column and
+        # bottom row belong to the neighbouring chunks, so they are dropped
+        size = WORLD_CHUNK_CELLS
+        bordered = bytearray(b'\x01' * ((size + 1) * (size + 1)))
+        rng = random.Random(f"{self.seed}:{chunk_x}:{chunk_y}")
+        MAZE_GENERATORS[self.generator](bordered, size + 1, size + 1, rng)
+        cells = bytearray(size * size)
+        for y in range(size):
+            cells[y * size:(y + 1) * size] = bordered[y * (size + 1):y * (size + 1) + size]
+
+        # Doors through the left and top borders. They are seeded by the border
+        # itself, so both neighbours agree on them and every chunk stays reachable.
+        for side, stride in (('left', size), ('top', 1)):
+            border_rng = random.Random(f"{self.seed}:{side}:{chunk_x}:{chunk_y}")
+            for _ in range(1 + (border_rng.random() < 0.5)):
+                door = 2 * border_rng.randrange(size // 2) + 1
+                cells[door * stride] = 0
+        return cells
+
+    def is_wall_cell(self, cell_x, cell_y):
+        cells = self.world_chunk(cell_x // WORLD_CHUNK_CELLS, cell_y // WORLD_CHUNK_CELLS)
+        return cells[(cell_y % WORLD_CHUNK_CELLS) * WORLD_CHUNK_CELLS + cell_x % WORLD_CHUNK_CELLS] == 1
+
+    def clamp_cells(self, first_x, first_y, last_x, last_y):
+        return first_x, first_y, last_x, last_y
+
+    def cell_row(self, y, first_x, last_x):
+        size = WORLD_CHUNK_CELLS
+        chunk_y, local_y = divmod(y, size)
+        row = bytearray()
+        x = first_x
+        while x < last_x:
+            chunk_x, local_x = divmod(x, size)
+            take = min(size - local_x, last_x - x)
+            start = local_y * size + local_x
+            row += self.world_chunk(chunk_x, chunk_y)[start:start + take]
+            x += take
+        return row
+
+# Saved mazes: a fixed little-endian header, then one bit per cell (1 = wall) in the
+# PackedWalls layout. The exit is in the header, so a single bit covers every cell.
+MAZE_FILE_MAGIC = b'AMZE'
+MAZE_FILE_VERSION = 1
+# magic, version, bits per cell, width, height, seed, exit x, exit y (-1 for none), generator
+MAZE_FILE_HEADER = struct.Struct('<4sHBxIIQii16s')
+
+def save_maze(maze, path):
+    generator = maze.generator.encode('ascii')
+    if len(generator) > 16:
+        raise ValueError(f"generator name {maze.generator!r} is longer than 16 characters")
+    if not 0 <= maze.seed < 2 ** 64:
+        raise ValueError(f"seed {maze.seed!r} does not fit the maze file header")
+    exit_x, exit_y = maze.exit if maze.exit is not None else (-1, -1)
+    header = MAZE_FILE_HEADER.pack(MAZE_FILE_MAGIC, MAZE_FILE_VERSION, 1, maze.width, maze.height,
+                                   maze.seed, exit_x, exit_y, generator)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header)
+        f.write(maze.pack_walls().bits)
+    os.replace(path + '.tmp', path)
+
+def load_maze(path):
+    return MappedMaze(path)
+
+class MappedMaze(Maze):
+    # A saved maze used in place: walls are read straight from the memory-mapped file,
+    # so opening it costs the same at any size. The mapping is read-only.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            width, height, seed, exit_x, exit_y, generator = self.read_header(path)
+        except ValueError:
+            self.map.close()
+            raise
 
-    def draw(self, camera_x, camera_y):
-        screen.fill((0, 0, 0))  # Fill the screen with black
-        
-        player_center_x = camera_x + WIDTH // 2
-        player_center_y = camera_y + HEIGHT // 2
-
-        for y in range(self.height):
-            for x in range(self.width):
-                screen_x = x * CELL_SIZE - camera_x
-                screen_y = y * CELL_SIZE - camera_y
-                if 0 <= screen_x < WIDTH and 0 <= screen_y < HEIGHT:
-                    if self.grid[y][x] == 1:
-                        lighting = calculate_lighting(player_center_x, player_center_y, screen_x + CELL_SIZE // 2, screen_y + CELL_SIZE // 2)
-                        wall_color = (min(255, LIGHT_LEVEL + lighting), min(255, LIGHT_LEVEL + lighting), min(255, LIGHT_LEVEL + lighting))
-                        wall_surface = pygame.Surface((CELL_SIZE, CELL_SIZE))
-                        wall_surface.fill(wall_color)
-                        wall_surface.blit(wall_texture, (0, 0))
-                        screen.blit(wall_surface, (screen_x, screen_y))
-                    elif self.grid[y][x] == 2:
-                        pygame.draw.rect(screen, BLUE, (screen_x, screen_y, CELL_SIZE, CELL_SIZE))
-                    elif self.grid[y][x] == 0:
-                        screen.blit(floor_texture, (screen_x, screen_y))
-
-def calculate_lighting(player_x, player_y, cell_x, cell_y):
-    distance = math.sqrt((player_x - cell_x) ** 2 + (player_y - cell_y) ** 2)
-    if distance < VISIBILITY_RADIUS - FADE_RADIUS:
-        return 255  # Fully lit inside the visibility radius
-    elif distance < VISIBILITY_RADIUS:
-        return int(255 * (VISIBILITY_RADIUS - distance) / FADE_RADIUS)
-    else:
-        return 0  # Fully dark outside the visibility radius
+        size = (width * height + 7) // 8
+        self.bits = memoryview(self.map)[MAZE_FILE_HEADER.size:MAZE_FILE_HEADER.size + size]
+        self.width = width
+        self.height = height
+        self.generator = generator.rstrip(b'\x00').decode('ascii')
+        self.seed = seed
+        self.exit = None if exit_x < 0 else (exit_x, exit_y)
+        self.chunks = OrderedDict()
+        self.chunk_cell_size = CELL_SIZE
+        self.distance_field = None
+        self.unpacked = None
+
+    def read_header(self, path):
+        if len(self.map) < MAZE_FILE_HEADER.size:
+            raise ValueError(f"{path} is not a maze file")
+        magic, version, bits_per_cell, width, height, seed, exit_x, exit_y, generator = \
+            MAZE_FILE_HEADER.unpack_from(self.map)
+        if magic != MAZE_FILE_MAGIC:
+            raise ValueError(f"{path} is not a maze file")
+        if version != MAZE_FILE_VERSION:
+            raise ValueError(f"{path} is maze file version {version}, only version {MAZE_FILE_VERSION} is supported")
+        if bits_per_cell != 1:
+            raise ValueError(f"{path} stores {bits_per_cell} bits per cell, only 1 is supported")
+        if len(self.map) < MAZE_FILE_HEADER.size + (width * height + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return width, height, seed, exit_x, exit_y, generator
+
+    def is_wall_cell(self, cell_x, cell_y):
+        if cell_x < 0 or cell_x >= self.width or cell_y < 0 or cell_y >= self.height:
+            return True
+        i = cell_y * self.width + cell_x
+        return (self.bits[i >> 3] >> (i & 7)) & 1 == 1
+
+    def unpack_cells(self, start, stop):
+        # Cell values (0 floor, 1 wall, 2 exit) for flat indices start:stop
+        if np is not None:
+            bits = np.frombuffer(self.bits[start >> 3:(stop + 7) >> 3], dtype=np.uint8)
+            offset = start & 7
+            cells = bytearray(np.unpackbits(bits, bitorder='little')[offset:offset + stop - start].tobytes())
+        else:
+            bits = self.bits
+            cells = bytearray((bits[i >> 3] >> (i & 7)) & 1 for i in range(start, stop))
+        if self.exit is not None:
+            exit_index = self.exit[1] * self.width + self.exit[0]
+            if start <= exit_index < stop:
+                cells[exit_index - start] = 2
+        return cells
+
+    @property
+    def cells(self):
+        # Whole-maze cell buffer for code that scans every cell, unpacked on first use
+        if self.unpacked is None:
+            self.unpacked = self.unpack_cells(0, self.width * self.height)
+        return self.unpacked
+
+    def cell_row(self, y, first_x, last_x):
+        return self.unpack_cells(y * self.width + first_x, y * self.width + last_x)
+
+    def set_cell(self, x, y, value):
+        raise TypeError("a mapped maze is read-only")
+
+    def close(self):
+        self.bits.release()
+        self.map.close()
+
+# Maze generators carve passages into a flat cell buffer that starts as all walls.
+# Rooms sit on odd coordinates; the cell between two joined rooms is opened too.
+
+def generate_backtracker(cells, width, height, rng):
+    stack = [(1, 1)]
+    cells[width + 1] = 0
+
+    while stack:
+        x, y = stack[-1]
+        i = y * width + x
+        valid_neighbors = []
+        if x + 2 < width - 1 and cells[i + 2] == 1:
+            valid_neighbors.append((x + 2, y))
+        if x - 2 > 0 and cells[i - 2] == 1:
+            valid_neighbors.append((x - 2, y))
+        if y + 2 < height - 1 and cells[i + 2 * width] == 1:
+            valid_neighbors.append((x, y + 2))
+        if y - 2 > 0 and cells[i - 2 * width] == 1:
+            valid_neighbors.append((x, y - 2))
+
+        if valid_neighbors:
+            nx, ny = rng.choice(valid_neighbors)
+            cells[ny * width + nx] = 0
+            cells[(y + ny) // 2 * width + (x + nx) // 2] = 0
+            stack.append((nx, ny))
+        else:
+            stack.pop()
+
+def generate_kruskal(cells, width, height, rng):
+    cols, rows = (width - 1) // 2, (height - 1) // 2
+    if cols <= 0 or rows <= 0:
+        return
+
+    # Every wall cell that separates two rooms, in random order
+    walls = array('i')
+    for ry in range(rows):
+        y = 2 * ry + 1
+        for rx in range(cols):
+            x = 2 * rx + 1
+            cells[y * width + x] = 0
+            if rx + 1 < cols:
+                walls.append(y * width + x + 1)
+            if ry + 1 < rows:
+                walls.append((y + 1) * width + x)
+    rng.shuffle(walls)
+
+    parent = array('i', range(cols * rows))
+
+    def find(room):
+        while parent[room] != room:
+            parent[room] = parent[parent[room]]
+            room = parent[room]
+        return room
+
+    for wall in walls:
+        y, x = divmod(wall, width)
+        if y % 2 == 1:  # Between horizontal neighbors
+            a, b = (x - 2) // 2 + (y // 2) * cols, x // 2 + (y // 2) * cols
+        else:  # Between vertical neighbors
+            a, b = x // 2 + (y - 2) // 2 * cols, x // 2 + (y // 2) * cols
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_b] = root_a
+            cells[wall] = 0
+
+def generate_wilson(cells, width, height, rng):
+    cols, rows = (width - 1) // 2, (height - 1) // 2
+    if cols <= 0 or rows <= 0:
+        return
+
+    steps = ((1, 0), (-1, 0), (0, 1), (0, -1))
+    in_maze = bytearray(cols * rows)
+    exits = bytearray(cols * rows)  # Direction last taken out of each room by the current walk
+
+    first = rng.randrange(cols * rows)
+    in_maze[first] = 1
+    cells[(2 * (first // cols) + 1) * width + 2 * (first % cols) + 1] = 0
+
+    # Loop-erased random walks; the visiting order does not bias the result
+    for start in range(cols * rows):
+        room = start
+        while not in_maze[room]:
+            rx, ry = room % cols, room // cols
+            while True:
+                direction = rng.randrange(4)
+                dx, dy = steps[direction]
+                if 0 <= rx + dx < cols and 0 <= ry + dy < rows:
+                    break
+            exits[room] = direction
+            room = (ry + dy) * cols + rx + dx
+
+        room = start
+        while not in_maze[room]:
+            in_maze[room] = 1
+            rx, ry = room % cols, room // cols
+            dx, dy = steps[exits[room]]
+            x, y = 2 * rx + 1, 2 * ry + 1
+            cells[y * width + x] = 0
+            cells[(y + dy) * width + x + dx] = 0
+            room = (ry + dy) * cols + rx + dx
+
+def eller_rows(width, height, rng):
+    # Yields the maze one cell row at a time keeping only O(width) state.
+    # With height=None the rows never end, so arbitrarily tall mazes can be streamed.
+    wall_row = b'\x01' * width
+    cols = (width - 1) // 2
+    rows = None if height is None else (height - 1) // 2
+    if cols <= 0 or rows == 0:
+        for _ in range(height or 0):
+            yield wall_row
+        return
+
+    yield wall_row
+    labels = [0] * cols  # Set label per room column, 0 means not in a set yet
+    members = {}
+    next_label = 1
+    row_index = 0
+    while rows is None or row_index < rows:
+        last = rows is not None and row_index == rows - 1
+        for c in range(cols):
+            if labels[c] == 0:
+                labels[c] = next_label
+                members[next_label] = [c]
+                next_label += 1
+
+        # Join adjacent rooms in different sets; the last row joins everything left
+        row = bytearray(wall_row)
+        for c in range(cols):
+            row[2 * c + 1] = 0
+        for c in range(cols - 1):
+            a, b = labels[c], labels[c + 1]
+            if a != b and (last or rng.random() < 0.5):
+                row[2 * c + 2] = 0
+                if len(members[a]) < len(members[b]):
+                    a, b = b, a
+                for m in members[b]:
+                    labels[m] = a
+                members[a].extend(members.pop(b))
+        yield bytes(row)
+        if last:
+            break
+
+        # Every set carries on downwards through at least one room
+        below = bytearray(wall_row)
+        new_labels = [0] * cols
+        new_members = {}
+        for label, set_cols in members.items():
+            carried = [c for c in set_cols if rng.random() < 0.5] or [rng.choice(set_cols)]
+            for c in carried:
+                below[2 * c + 1] = 0
+                new_labels[c] = label
+            new_members[label] = carried
+        labels, members = new_labels, new_members
+        yield bytes(below)
+        row_index += 1
+
+    # Bottom border, plus a spare wall row for even heights
+    for _ in range(height - 2 * rows):
+        yield wall_row
+
+def generate_eller(cells, width, height, rng):
+    for y, row in enumerate(eller_rows(width, height, rng)):
+        cells[y * width:(y + 1) * width] = row
+
+MAZE_GENERATORS = {
+    'backtracker': generate_backtracker,
+    'kruskal': generate_kruskal,
+    'wilson': generate_wilson,
+    'eller': generate_eller,
+}
 
-def create_fog_of_war():
-    fog_surface.fill((0, 0, 0, 255))  # Completely black and opaque
-    
-    for x in range(WIDTH):
-        for y in range(HEIGHT):
-            distance = math.sqrt((x - WIDTH // 2) ** 2 + (y - HEIGHT // 2) ** 2)
-            if distance < VISIBILITY_RADIUS - FADE_RADIUS:
-                fog_surface.set_at((x, y), (0, 0, 0, 0))  # Completely transparent
-            elif distance < VISIBILITY_RADIUS:
-                alpha = int(255 * (distance - (VISIBILITY_RADIUS - FADE_RADIUS)) / FADE_RADIUS)
-                fog_surface.set_at((x, y), (0, 0, 0, alpha))
-    
-    return fog_surface
+def benchmark_maze_generators(size=501, seed=1):
+    # Returns 1 if a generator is not reproducible from its seed, for sys.exit()
+    failed = False
+    for name in MAZE_GENERATORS:
+        start = time.perf_counter()
+        maze = Maze(size, size, generator=name, seed=seed)
+        elapsed = time.perf_counter() - start
+
+        # Separate run for memory, tracemalloc slows allocation down
+        tracemalloc.start()
+        Maze(size, size, generator=name, seed=seed)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        reproducible = Maze(size, size, generator=name, seed=seed).cells == maze.cells
+        failed = failed or not reproducible
+        print(f"{name:>11}: {size * size / elapsed:12,.0f} cells/s   peak {peak / 1e6:7.2f} MB   "
+              f"{'reproducible' if reproducible else 'NOT reproducible'}")
+
+    # Streaming Eller's never holds more than a couple of rows
+    tall = size * 20
+    start = time.perf_counter()
+    for _ in eller_rows(size, tall, random.Random(seed)):
+        pass
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for _ in eller_rows(size, tall, random.Random(seed)):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"eller stream {size}x{tall}: {size * tall / elapsed:12,.0f} cells/s   peak {peak / 1e6:7.2f} MB")
+    return 1 if failed else 0
+
+# Path finding. Cells are (x, y) tuples; anything that is not a wall is walkable.
+
+UNREACHABLE = -1
+
+class ExitDistanceField:
+    # Steps from every cell to maze.exit, found by one BFS and kept in a flat int
+    # array, so the way to the exit from any cell is a few lookups. Relies on the
+    # maze border being wall, which Maze.set_cell enforces.
+    def __init__(self, maze):
+        self.maze = maze
+        self.width = maze.width
+        self.rebuild()
+
+    def rebuild(self):
+        width, cells = self.width, self.maze.cells
+        distances = array('i', [UNREACHABLE]) * len(cells)
+        exit_x, exit_y = self.maze.exit
+        frontier = [exit_y * width + exit_x]
+        distances[frontier[0]] = 0
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for i in frontier:
+                for j in (i - 1, i + 1, i - width, i + width):
+                    if distances[j] == UNREACHABLE and cells[j] != 1:
+                        distances[j] = distance
+                        next_frontier.append(j)
+            frontier = next_frontier
+        self.distances = distances
+
+    def distance(self, cell_x, cell_y):
+        # Steps to the exit, or None if the exit cannot be reached from here
+        distance = self.distances[cell_y * self.width + cell_x]
+        return None if distance == UNREACHABLE else distance
+
+    def direction_to_exit(self, cell_x, cell_y):
+        # (dx, dy) of the neighbouring cell one step closer to the exit,
+        # (0, 0) on the exit itself and None when the exit is unreachable
+        i = cell_y * self.width + cell_x
+        distance = self.distances[i]
+        if distance == UNREACHABLE:
+            return None
+        if distance == 0:
+            return (0, 0)
+        for dx, dy, j in ((1, 0, i + 1), (-1, 0, i - 1), (0, 1, i + self.width), (0, -1, i - self.width)):
+            if self.distances[j] == distance - 1:
+                return (dx, dy)
+        return None
+
+    def cell_changed(self, cell_x, cell_y):
+        i = cell_y * self.width + cell_x
+        if (cell_x, cell_y) == self.maze.exit:
+            self.rebuild()
+        elif self.maze.cells[i] == 1:
+            self.cell_closed(i)
+        else:
+            self.cell_opened(i)
 
-class MenuParticle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.size = random.randint(1, 3)
-        self.color = random.choice([(51, 206, 161), (45, 185, 144), (40, 164, 128), (35, 144, 112)])
-        self.vel = pygame.Vector2(0, -random.uniform(1, 3))  # Vertical movement only
-        self.lifetime = random.randint(40, 500)
+    def neighbors(self, i):
+        return (i - 1, i + 1, i - self.width, i + self.width)
 
-    def update(self):
-        self.x += self.vel.x
-        self.y += self.vel.y
-        self.lifetime -= 1
+    def cell_opened(self, i):
+        # Distances can only shrink: spread improvements out from the new cell
+        distances, cells = self.distances, self.maze.cells
+        reachable = [distances[j] for j in self.neighbors(i) if distances[j] != UNREACHABLE]
+        if not reachable:
+            return
+        distances[i] = min(reachable) + 1
+        queue = deque([i])
+        while queue:
+            current = queue.popleft()
+            distance = distances[current] + 1
+            for j in self.neighbors(current):
+                if cells[j] != 1 and (distances[j] == UNREACHABLE or distances[j] > distance):
+                    distances[j] = distance
+                    queue.append(j)
+
+    def cell_closed(self, i):
+        distances, cells = self.distances, self.maze.cells
+        if distances[i] == UNREACHABLE:
+            return
 
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.size)
+        # Every cell whose distance may have been routed through the closed one
+        affected = {i}
+        stack = [i]
+        while stack:
+            current = stack.pop()
+            for j in self.neighbors(current):
+                if j not in affected and distances[j] == distances[current] + 1:
+                    affected.add(j)
+                    stack.append(j)
+        for j in affected:
+            distances[j] = UNREACHABLE
+
+        # Re-seed them from the untouched cells around them, nearest first
+        heap = []
+        for j in affected:
+            if cells[j] != 1:
+                for k in self.neighbors(j):
+                    if distances[k] != UNREACHABLE:
+                        heap.append((distances[k] + 1, j))
+        heapq.heapify(heap)
+        while heap:
+            distance, j = heapq.heappop(heap)
+            if distances[j] != UNREACHABLE and distances[j] <= distance:
+                continue
+            distances[j] = distance
+            for k in self.neighbors(j):
+                if cells[k] != 1 and (distances[k] == UNREACHABLE or distances[k] > distance + 1):
+                    heapq.heappush(heap, (distance + 1, k))
+
+def reconstruct_path(came_from, cell):
+    path = []
+    while cell is not None:
+        path.append(cell)
+        cell = came_from[cell]
+    path.reverse()
+    return path
+
+def find_path(maze, start, goal):
+    # A* with the Manhattan distance; returns the list of cells from start to goal, or None
+    if maze.is_wall_cell(*start) or maze.is_wall_cell(*goal):
+        return None
+    goal_x, goal_y = goal
+    came_from = {start: None}
+    cost = {start: 0}
+    heap = [(abs(start[0] - goal_x) + abs(start[1] - goal_y), 0, 0, start)]
+    while heap:
+        _, _, steps, cell = heapq.heappop(heap)
+        if cell == goal:
+            return reconstruct_path(came_from, cell)
+        if steps > cost[cell]:
+            continue  # Stale entry
+        x, y = cell
+        for neighbor in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if (neighbor not in cost or steps + 1 < cost[neighbor]) and not maze.is_wall_cell(*neighbor):
+                cost[neighbor] = steps + 1
+                came_from[neighbor] = cell
+                # Ties go to the deeper node, which keeps the search narrow in corridors
+                heapq.heappush(heap, (steps + 1 + abs(neighbor[0] - goal_x) + abs(neighbor[1] - goal_y), -(steps + 1),
+                                      steps + 1, neighbor))
+    return None
+
+def find_path_bidirectional(maze, start, goal):
+    # Breadth-first from both ends, always growing the smaller frontier
+    if maze.is_wall_cell(*start) or maze.is_wall_cell(*goal):
+        return None
+    if start == goal:
+        return [start]
+    forward, backward = {start: None}, {goal: None}
+    forward_frontier, backward_frontier = [start], [goal]
+    while forward_frontier and backward_frontier:
+        grow_forward = len(forward_frontier) <= len(backward_frontier)
+        frontier = forward_frontier if grow_forward else backward_frontier
+        parents, others = (forward, backward) if grow_forward else (backward, forward)
+
+        next_frontier = []
+        for cell in frontier:
+            x, y = cell
+            for neighbor in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if neighbor in parents or maze.is_wall_cell(*neighbor):
+                    continue
+                parents[neighbor] = cell
+                if neighbor in others:
+                    path = reconstruct_path(forward, neighbor)
+                    cell = backward[neighbor]
+                    while cell is not None:
+                        path.append(cell)
+                        cell = backward[cell]
+                    return path
+                next_frontier.append(neighbor)
+
+        if grow_forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+    return None
+
+def benchmark_paths(sizes=(501, 1001, 2001, 4001), edits=200, seed=1):
+    # Returns 1 if any check failed, for sys.exit()
+    failed = False
+    for size in sizes:
+        maze = Maze(size, size, seed=seed)
+        start_cell = (1, 1)
+
+        start = time.perf_counter()
+        field = maze.exit_distances()
+        build = time.perf_counter() - start
+
+        queries = 100000
+        start = time.perf_counter()
+        for _ in range(queries):
+            field.direction_to_exit(1, 1)
+        query = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        astar = find_path(maze, start_cell, maze.exit)
+        astar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        bidirectional = find_path_bidirectional(maze, start_cell, maze.exit)
+        bidirectional_time = time.perf_counter() - start
+        agree = len(astar) == len(bidirectional) == field.distance(*start_cell) + 1
+
+        # Random wall edits, applied incrementally and checked against a full rebuild
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        for _ in range(edits):
+            x, y = rng.randrange(1, size - 1), rng.randrange(1, size - 1)
+            if (x, y) != maze.exit:
+                maze.set_cell(x, y, 0 if maze.cells[y * size + x] == 1 else 1)
+        incremental = (time.perf_counter() - start) / edits
+        expected = array('i', field.distances)
+        field.rebuild()
+        consistent = expected == field.distances
+        failed = failed or not (agree and consistent)
+
+        print(f"paths {size:>5}x{size:<5} field {build * 1000:8.1f} ms   hint {query * 1e6:5.2f} us   "
+              f"A* {astar_time * 1000:8.1f} ms   bidir {bidirectional_time * 1000:8.1f} ms   "
+              f"edit {incremental * 1000:6.2f} ms   "
+              f"{'ok' if agree and consistent else 'MISMATCH'}")
+
+    # Perfect mazes have one path between any two cells, so check shortest paths on
+    # a maze with loops knocked into it against the BFS distances of the exit field
+    rng = random.Random(seed)
+    maze = Maze(41, 41, seed=seed)
+    for _ in range(150):
+        x, y = rng.randrange(1, 40), rng.randrange(1, 40)
+        if (x + y) % 2 == 1:  # Walls between two rooms
+            maze.set_cell(x, y, 0)
+    field = maze.exit_distances()
+    floor = [(x, y) for y in range(1, 40) for x in range(1, 40) if not maze.is_wall_cell(x, y)]
+    wrong = 0
+    for _ in range(800):
+        cell = rng.choice(floor)
+        expected = field.distance(*cell)
+        for path in (find_path(maze, cell, maze.exit), find_path_bidirectional(maze, cell, maze.exit)):
+            if (path is None) != (expected is None) or (path is not None and len(path) != expected + 1):
+                wrong += 1
+    print(f"paths with loops: 800 queries, {wrong} not shortest   {'ok' if wrong == 0 else 'MISMATCH'}")
+    return 1 if failed or wrong else 0
+
+class PackedWalls:
+    # Read-only wall bitmap, one bit per cell (1 = wall), row-major, LSB first
+    def __init__(self, cells, width, height):
+        self.width = width
+        self.height = height
+        if np is not None:
+            walls = np.frombuffer(cells, dtype=np.uint8) == 1
+            self.bits = bytearray(np.packbits(walls, bitorder='little').tobytes())
+        else:
+            self.bits = bytearray((width * height + 7) // 8)
+            for i, cell in enumerate(cells):
+                if cell == 1:
+                    self.bits[i >> 3] |= 1 << (i & 7)
 
+    def is_wall_cell(self, cell_x, cell_y):
+        if cell_x < 0 or cell_x >= self.width or cell_y < 0 or cell_y >= self.height:
+            return True
+        i = cell_y * self.width + cell_x
+        return (self.bits[i >> 3] >> (i & 7)) & 1 == 1
 
-class Particle:
-    def __init__(self, x, y, direction):
-        self.x = x
-        self.y = y
-        self.size = random.randint(1, 3)
-        self.color = random.choice(BUTTON_PARTICLE_COLORS
-    )
-        self.vel = pygame.Vector2(direction)
-        self.vel.scale_to_length(random.uniform(1, 2))
-        self.lifetime = random.randint(10, 40)
+    def is_wall(self, x, y):
+        return self.is_wall_cell(int(x // CELL_SIZE), int(y // CELL_SIZE))
+
+    def nbytes(self):
+        return len(self.bits)
+
+def benchmark_maze_sizes(sizes=(25, 501, 2001, 4001)):
+    for size in sizes:
+        start = time.perf_counter()
+        maze = Maze(size, size)
+        elapsed = time.perf_counter() - start
+
+        grid_bytes = len(maze.cells) + sys.getsizeof(maze.grid) + sum(sys.getsizeof(row) for row in maze.grid)
+        # What the old list-of-lists grid cost: a list object per row plus one pointer per cell
+        list_bytes = sys.getsizeof(maze.grid) + size * sys.getsizeof([1] * size)
+        packed_bytes = maze.pack_walls().nbytes()
+        print(f"maze {size:>5}x{size:<5} generate {elapsed:8.2f} s   "
+              f"grid {grid_bytes / 1e6:8.2f} MB   packed {packed_bytes / 1e6:8.2f} MB   "
+              f"(list of lists {list_bytes / 1e6:8.2f} MB)")
+
+def benchmark_maze_files(sizes=(501, 2001, 4001), probes=100000, seed=1):
+    # Round-trips mazes through the file format and compares opening one with generating it.
+    # Returns 1 if any check failed, for sys.exit()
+    rng = random.Random(seed)
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f'maze_{size}.amz')
+            start = time.perf_counter()
+            maze = Maze(size, size, seed=seed)
+            generate = time.perf_counter() - start
+            start = time.perf_counter()
+            save_maze(maze, path)
+            save = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = load_maze(path)
+            load = time.perf_counter() - start
+
+            cells = [(rng.randrange(-1, size + 1), rng.randrange(-1, size + 1)) for _ in range(probes)]
+            start = time.perf_counter()
+            walls = [loaded.is_wall_cell(x, y) for x, y in cells]
+            probe = time.perf_counter() - start
+            same = (walls == [maze.is_wall_cell(x, y) for x, y in cells]
+                    and loaded.cell_row(size // 2, 3, size - 3) == maze.cell_row(size // 2, 3, size - 3)
+                    and loaded.cells == maze.cells
+                    and (loaded.width, loaded.height, loaded.seed, loaded.exit, loaded.generator)
+                    == (maze.width, maze.height, maze.seed, maze.exit, maze.generator))
+            failed = failed or not same
+            file_size = os.path.getsize(path)
+            loaded.close()
+            print(f"maze file {size:>5}x{size:<5} {file_size / 1e6:6.2f} MB   generate {generate * 1000:9.2f} ms   "
+                  f"save {save * 1000:7.2f} ms   load {load * 1000:6.3f} ms   "
+                  f"is_wall {probe / probes * 1e9:5.0f} ns   {'ok' if same else 'MISMATCH'}")
+
+        # Damaged files are refused instead of read past their end
+        with open(path, 'rb') as f:
+            data = f.read()
+        for name, damaged in (('truncated', data[:len(data) // 2]), ('bad magic', b'XXXX' + data[4:]),
+                              ('future version', data[:4] + b'\x63\x00' + data[6:])):
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            try:
+                load_maze(path).close()
+                print(f"maze file {name}: loaded, MISMATCH")
+                failed = True
+            except ValueError as e:
+                print(f"maze file {name}: refused ({e})")
+    return 1 if failed else 0
+
+# Level pack building: generate and score many mazes across worker processes. Maze
+# i is always generated from the same seed, results are appended to a JSON lines
+# file one chunk at a time, and a rerun skips the mazes already in the file.
+BATCH_CHUNK = 64  # Mazes per worker task and per write
+
+def score_maze(maze):
+    # Solution length from the player start, dead ends and the share of open cells
+    # that are junctions (three or more open neighbours)
+    width, cells = maze.width, maze.cells
+    open_cells = dead_ends = junctions = 0
+    for y in range(1, maze.height - 1):
+        for i in range(y * width + 1, (y + 1) * width - 1):
+            if cells[i] == 1:
+                continue
+            open_cells += 1
+            exits = (cells[i - 1] != 1) + (cells[i + 1] != 1) + (cells[i - width] != 1) + (cells[i + width] != 1)
+            if exits == 1:
+                dead_ends += 1
+            elif exits >= 3:
+                junctions += 1
+    return {
+        'solution_length': maze.exit_distances().distance(1, 1),
+        'dead_ends': dead_ends,
+        'branching': round(junctions / open_cells, 4) if open_cells else 0.0,
+    }
+
+def batch_seed(base_seed, index):
+    return random.Random(f"{base_seed}:{index}").randrange(2 ** 32)
+
+def in_band(value, band):
+    return value is not None and (band is None or band[0] <= value <= band[1])
+
+def generate_and_score_chunk(indices, width, height, generator, base_seed, bands, keep_dir):
+    # Runs in a worker process; returns one result row per maze
+    rows = []
+    for index in indices:
+        maze = Maze(width, height, generator=generator, seed=batch_seed(base_seed, index))
+        row = {'index': index, 'seed': maze.seed}
+        row.update(score_maze(maze))
+        row['kept'] = all(in_band(row[name], band) for name, band in bands.items())
+        if row['kept'] and keep_dir is not None:
+            save_maze(maze, os.path.join(keep_dir, f'maze_{index:06d}.amz'))
+        rows.append(row)
+    return rows
+
+def read_batch_progress(path, header):
+    # Indices already scored by an earlier run with the same settings
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            f.truncate(complete)  # Drop a row cut short by an interruption
+    lines = data[:complete].splitlines()
+    if not lines:
+        return set()
+    if json.loads(lines[0]) != header:
+        raise ValueError(f"{path} was written with different batch settings, use another output file")
+    return {json.loads(line)['index'] for line in lines[1:]}
+
+def run_batch(count, output, width=25, height=25, generator='backtracker', base_seed=0,
+              bands=None, keep_dir=None, workers=None, chunk=BATCH_CHUNK):
+    bands = bands or {}
+    # Everything a row depends on, kept bands included, so a resume cannot mix criteria
+    header = {'batch': 2, 'width': width, 'height': height, 'generator': generator, 'seed': base_seed,
+              'bands': {name: [None if math.isinf(bound) else bound for bound in band]
+                        for name, band in sorted(bands.items())},
+              'keep_dir': None if keep_dir is None else os.path.abspath(keep_dir)}
+    done = read_batch_progress(output, header)
+    todo = [index for index in range(count) if index not in done]
+    if keep_dir is not None:
+        os.makedirs(keep_dir, exist_ok=True)
+
+    scored = kept = 0
+    start = time.perf_counter()
+    with open(output, 'a') as f:
+        if not done and f.tell() == 0:
+            f.write(json.dumps(header) + '\n')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(generate_and_score_chunk, todo[i:i + chunk], width, height,
+                                       generator, base_seed, bands, keep_dir)
+                       for i in range(0, len(todo), chunk)]
+            try:
+                for future in as_completed(futures):
+                    rows = future.result()
+                    f.write(''.join(json.dumps(row) + '\n' for row in rows))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    scored += len(rows)
+                    kept += sum(row['kept'] for row in rows)
+            except KeyboardInterrupt:
+                executor.shutdown(wait=True, cancel_futures=True)
+                print(f"batch interrupted after {len(done) + scored}/{count} mazes, run again to resume")
+                raise
+    elapsed = time.perf_counter() - start
+    rate = scored / elapsed if elapsed else 0.0
+    print(f"batch scored {scored} mazes ({len(done)} already done), kept {kept}, "
+          f"{elapsed:.2f} s, {rate:.0f} mazes per second")
+    return scored
+
+def parse_band(text):
+    low, _, high = text.partition(':')
+    return (float(low) if low else float('-inf'), float(high) if high else float('inf'))
+
+def benchmark_batch(count=512, size=51):
+    # Mazes per second for a growing number of workers; near-linear up to the core count
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in worker_counts:
+            output = os.path.join(directory, f'batch_{workers}.jsonl')
+            start = time.perf_counter()
+            run_batch(count, output, size, size, workers=workers)
+            rate = count / (time.perf_counter() - start)
+            baseline = baseline or rate
+            print(f"batch {workers:3d} workers: {rate:8.1f} mazes per second   speedup {rate / baseline:5.2f}x")
+
+        # An interrupted run resumes where it stopped and matches a run that never stopped
+        output = os.path.join(directory, 'resume.jsonl')
+        run_batch(count // 2, output, size, size)
+        with open(output, 'a') as f:
+            f.write('{"index": ')  # A row cut off mid-write
+        run_batch(count, output, size, size)
+
+        def rows(path):
+            with open(path) as f:
+                return sorted(f.readlines()[1:], key=lambda line: json.loads(line)['index'])
+        same = rows(output) == rows(os.path.join(directory, f'batch_{worker_counts[0]}.jsonl'))
+        print(f"batch resume: {'ok' if same else 'MISMATCH'} on {os.cpu_count()} cores")
+    return 0 if same else 1  # For sys.exit()
+
+def fog_cache_key(scale=1.0):
+    # (width, height, visibility radius, fade radius) in pixels of the scene view
+    return tuple(round(value * scale) for value in (WIDTH, HEIGHT, VISIBILITY_RADIUS, FADE_RADIUS))
+
+def fog_alpha_numpy(key=None):
+    # Whole distance field in one pass, one alpha byte per pixel (row-major)
+    width, height, radius, fade = key or fog_cache_key()
+    ys, xs = np.ogrid[0:height, 0:width]
+    distance = np.sqrt((xs - width // 2) ** 2 + (ys - height // 2) ** 2)
+    alpha = np.clip(255 * (distance - (radius - fade)) / fade, 0, 255)
+    return alpha.astype(np.uint8).tobytes()
+
+def fog_alpha_python(key=None):
+    # Fallback without NumPy: everything outside the visibility box stays opaque,
+    # so only the pixels around the center need a distance
+    width, height, radius, fade = key or fog_cache_key()
+    alpha = bytearray(b'\xff' * (width * height))
+    center_x, center_y = width // 2, height // 2
+    inner_radius = radius - fade
+
+    for y in range(max(0, center_y - radius), min(height, center_y + radius + 1)):
+        row = y * width
+        dy2 = (y - center_y) ** 2
+        for x in range(max(0, center_x - radius), min(width, center_x + radius + 1)):
+            distance = math.sqrt((x - center_x) ** 2 + dy2)
+            if distance < inner_radius:
+                alpha[row + x] = 0  # Completely transparent
+            elif distance < radius:
+                alpha[row + x] = int(255 * (distance - inner_radius) / fade)
+    return bytes(alpha)
+
+def fog_alpha(key=None):
+    if np is not None:
+        return fog_alpha_numpy(key)
+    return fog_alpha_python(key)
+
+def fog_cache_path(key):
+    return os.path.join(FOG_CACHE_DIR, 'fog_{}x{}_{}_{}.bin'.format(*key))
+
+def load_fog_alpha(key):
+    try:
+        with open(fog_cache_path(key), 'rb') as f:
+            alpha = f.read()
+    except OSError:
+        return None
+    if len(alpha) != key[0] * key[1]:
+        return None  # Truncated or stale file, rebuild it
+    return alpha
+
+def save_fog_alpha(key, alpha):
+    path = fog_cache_path(key)
+    try:
+        os.makedirs(FOG_CACHE_DIR, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(alpha)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"Error saving fog cache: {e}")
+
+INVERT_BYTES = bytes(range(255, -1, -1))
+
+def light_map_from_alpha(alpha, size=(WIDTH, HEIGHT)):
+    # Fog and lighting in one surface: each pixel keeps (255 - fog alpha) / 255 of the scene
+    light = alpha.translate(INVERT_BYTES)
+    pixels = bytearray(b'\xff' * (size[0] * size[1] * 4))
+    pixels[0::4] = light
+    pixels[1::4] = light
+    pixels[2::4] = light
+    return pygame.image.frombuffer(pixels, size, 'RGBA').convert()
+
+def create_light_map(scale=1.0):
+    key = fog_cache_key(scale)
+    light_map = fog_cache.get(key)
+    if light_map is None:
+        alpha = load_fog_alpha(key)
+        if alpha is None:
+            alpha = fog_alpha(key)
+            save_fog_alpha(key, alpha)
+        light_map = light_map_from_alpha(alpha, key[:2])
+        fog_cache[key] = light_map
+    return light_map
+
+def apply_light_map(surface, light_map):
+    # The player is always at the center of the view, so the same map lights every frame
+    surface.blit(light_map, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+
+def benchmark_fog_of_war(repeats=3):
+    # Returns 1 if the build paths disagree, for sys.exit()
+    paths = [('python', fog_alpha_python)]
+    if np is not None:
+        paths.insert(0, ('numpy', fog_alpha_numpy))
+
+    results = {}
+    failed = False
+    for name, build in paths:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            alpha = build()
+            best = min(best, time.perf_counter() - start)
+        results[name] = alpha
+        print(f"fog {name:>6}: {best * 1000:9.2f} ms (best of {repeats})")
+
+    if len(results) == 2 and results['numpy'] != results['python']:
+        print("fog masks differ between paths!")
+        failed = True
+
+    fog_cache.clear()
+    start = time.perf_counter()
+    light_map = create_light_map()
+    print(f"fog  first: {(time.perf_counter() - start) * 1000:9.2f} ms (disk cache or build)")
+    start = time.perf_counter()
+    create_light_map()
+    print(f"fog cached: {(time.perf_counter() - start) * 1000:9.2f} ms")
+
+    frames = 200
+    start = time.perf_counter()
+    for _ in range(frames):
+        apply_light_map(screen, light_map)
+    print(f"fog  apply: {(time.perf_counter() - start) / frames * 1000:9.2f} ms per frame")
+    return 1 if failed else 0
+
+MENU_PARTICLE_COLORS = [(51, 206, 161), (45, 185, 144), (40, 164, 128), (35, 144, 112)]
+PARTICLE_MAX_SIZE = 3
+# How dense the effects look; the engine itself keeps up with tens of thousands
+BUTTON_PARTICLE_LIMIT = 100
+MENU_PARTICLE_LIMIT = 1000
+
+particle_rng = np.random.default_rng() if np is not None else None
+
+class ParticleEngine:
+    # Structure-of-arrays particle pool: one preallocated column per attribute.
+    # Dead particles are swap-removed so the live ones stay packed at the front.
+    def __init__(self, capacity, palette):
+        self.capacity = capacity
+        self.palette = palette
+        self.count = 0
+        if np is not None:
+            self.x = np.zeros(capacity, np.float32)
+            self.y = np.zeros(capacity, np.float32)
+            self.vx = np.zeros(capacity, np.float32)
+            self.vy = np.zeros(capacity, np.float32)
+            self.lifetime = np.zeros(capacity, np.int32)
+            self.size = np.zeros(capacity, np.uint8)
+            self.color = np.zeros(capacity, np.uint8)
+        else:
+            self.x = array('f', bytes(4 * capacity))
+            self.y = array('f', bytes(4 * capacity))
+            self.vx = array('f', bytes(4 * capacity))
+            self.vy = array('f', bytes(4 * capacity))
+            self.lifetime = array('i', bytes(4 * capacity))
+            self.size = array('B', bytes(capacity))
+            self.color = array('B', bytes(capacity))
+        self.columns = (self.x, self.y, self.vx, self.vy, self.lifetime, self.size, self.color)
+
+        # One pre-drawn sprite per (color, size), indexed by color * (PARTICLE_MAX_SIZE + 1) + size
+        self.sprites = []
+        for color in palette:
+            for size in range(PARTICLE_MAX_SIZE + 1):
+                sprite = pygame.Surface((2 * size + 1, 2 * size + 1), pygame.SRCALPHA)
+                pygame.draw.circle(sprite, color, (size, size), size)
+                self.sprites.append(sprite)
+
+        # Pixel offsets from the center covered by a circle of each size
+        self.offsets = []
+        for size in range(PARTICLE_MAX_SIZE + 1):
+            sprite = self.sprites[size]
+            self.offsets.append([(x - size, y - size) for y in range(2 * size + 1) for x in range(2 * size + 1)
+                                 if sprite.get_at((x, y)).a > 0])
+
+    def free(self):
+        return self.capacity - self.count
+
+    def spawn(self, xs, ys, vxs, vys, lifetimes, sizes, colors):
+        # Appends a batch of particles from equal-length sequences, dropping what does not fit
+        n = min(len(xs), self.free())
+        start, end = self.count, self.count + n
+        if np is not None:
+            for column, values in zip(self.columns, (xs, ys, vxs, vys, lifetimes, sizes, colors)):
+                column[start:end] = values[:n]
+        else:
+            for column, values in zip(self.columns, (xs, ys, vxs, vys, lifetimes, sizes, colors)):
+                for i in range(n):
+                    column[start + i] = values[i]
+        self.count = end
 
     def update(self):
-        self.x += self.vel.x
-        self.y += self.vel.y
-        self.lifetime -= 1
+        n = self.count
+        if np is not None:
+            self.x[:n] += self.vx[:n]
+            self.y[:n] += self.vy[:n]
+            self.lifetime[:n] -= 1
+        else:
+            x, y, vx, vy, lifetime = self.x, self.y, self.vx, self.vy, self.lifetime
+            for i in range(n):
+                x[i] += vx[i]
+                y[i] += vy[i]
+                lifetime[i] -= 1
+
+    def draw(self, surface):
+        if self.count == 0:
+            return
+        if np is not None and surface.get_bytesize() == 4:
+            self.draw_pixels(surface)
+        else:
+            self.draw_sprites(surface)
+
+    def draw_pixels(self, surface):
+        # Writes every particle's pixels straight into the surface, one size at a time
+        n = self.count
+        pixels = pygame.surfarray.pixels2d(surface)
+        width, height = pixels.shape
+        mapped = np.array([surface.map_rgb(color) for color in self.palette], dtype=pixels.dtype)
+        xs = self.x[:n].astype(np.int32)
+        ys = self.y[:n].astype(np.int32)
+        colors = mapped[self.color[:n]]
+        sizes = self.size[:n]
+        for size, offsets in enumerate(self.offsets):
+            selected = np.flatnonzero(sizes == size)
+            if len(selected) == 0:
+                continue
+            sx, sy, scolors = xs[selected], ys[selected], colors[selected]
+            for dx, dy in offsets:
+                px, py = sx + dx, sy + dy
+                inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+                pixels[px[inside], py[inside]] = scolors[inside]
+        del pixels  # Unlocks the surface
+
+    def draw_sprites(self, surface):
+        n = self.count
+        stride = PARTICLE_MAX_SIZE + 1
+        sprites = self.sprites
+        tiles = []
+        for i in range(n):
+            size = int(self.size[i])
+            tiles.append((sprites[int(self.color[i]) * stride + size], (int(self.x[i]) - size, int(self.y[i]) - size)))
+        surface.blits(tiles, doreturn=False)
+
+    def compact(self):
+        n = self.count
+        if np is not None:
+            dead = np.flatnonzero(self.lifetime[:n] <= 0)
+            if len(dead) == 0:
+                return
+            alive_count = n - len(dead)
+            # Holes left before the new end are filled by survivors from past it
+            holes = dead[dead < alive_count]
+            survivors = np.flatnonzero(self.lifetime[alive_count:n] > 0) + alive_count
+            for column in self.columns:
+                column[holes] = column[survivors]
+            self.count = alive_count
+        else:
+            lifetime = self.lifetime
+            i = 0
+            while i < n:
+                if lifetime[i] <= 0:
+                    n -= 1
+                    for column in self.columns:
+                        column[i] = column[n]
+                else:
+                    i += 1
+            self.count = n
+
+    def update_and_draw(self, screen):
+        # Particles are drawn on the frame their lifetime runs out, then removed
+        self.update()
+        self.draw(screen)
+        self.compact()
 
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.size)
+def spawn_menu_particle(engine, x, y):
+    # Rises straight up from (x, y)
+    engine.spawn([x], [y], [0.0], [-random.uniform(1, 3)], [random.randint(40, 500)],
+                 [random.randint(1, 3)], [random.randrange(len(engine.palette))])
 
 class ParticleSystem:
-    def __init__(self):
-        self.particles = []
-        self.max_particles = 100  # Limit the maximum number of particles
+    def __init__(self, max_particles=BUTTON_PARTICLE_LIMIT):
+        self.max_particles = max_particles  # Limit the maximum number of particles
+        self.engine = ParticleEngine(max_particles, BUTTON_PARTICLE_COLORS)
 
     def emit(self, x, y, width, height):
-        directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]  # Right, Down, Left, Up
-        for direction in directions:
-            for i in range(width + height):
-                if len(self.particles) < self.max_particles:  # Limit particle emission
-                    if direction in [(1, 0), (-1, 0)]:
-                        pos_x = x + direction[0] * i
-                        pos_y = y + random.randint(0, height)
-                    else:
-                        pos_x = x + random.randint(0, width)
-                        pos_y = y + direction[1] * i
-                    particle = Particle(pos_x, pos_y, direction)
-                    self.particles.append(particle)
+        # Particles stream out of each side of the rect: right, down, left, up.
+        # Only as many as fit are created, in the same order as the sides.
+        per_side = width + height
+        n = min(self.engine.free(), 4 * per_side)
+        if n <= 0:
+            return
+        colors = len(BUTTON_PARTICLE_COLORS)
+        if np is not None:
+            index = np.arange(n)
+            side, step = index // per_side, index % per_side
+            dx = np.array([1, 0, -1, 0])[side]
+            dy = np.array([0, 1, 0, -1])[side]
+            horizontal = dx != 0
+            xs = np.where(horizontal, x + dx * step, x + particle_rng.integers(0, width, n, endpoint=True))
+            ys = np.where(horizontal, y + particle_rng.integers(0, height, n, endpoint=True), y + dy * step)
+            speed = particle_rng.uniform(1, 2, n)
+            self.engine.spawn(xs, ys, dx * speed, dy * speed, particle_rng.integers(10, 40, n, endpoint=True),
+                              particle_rng.integers(1, 3, n, endpoint=True), particle_rng.integers(0, colors, n))
+        else:
+            directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+            xs, ys, vxs, vys = [], [], [], []
+            for i in range(n):
+                dx, dy = directions[i // per_side]
+                step = i % per_side
+                if dx != 0:
+                    xs.append(x + dx * step)
+                    ys.append(y + random.randint(0, height))
+                else:
+                    xs.append(x + random.randint(0, width))
+                    ys.append(y + dy * step)
+                speed = random.uniform(1, 2)
+                vxs.append(dx * speed)
+                vys.append(dy * speed)
+            self.engine.spawn(xs, ys, vxs, vys, [random.randint(10, 40) for _ in range(n)],
+                              [random.randint(1, 3) for _ in range(n)], [random.randrange(colors) for _ in range(n)])
 
     def update_and_draw(self, screen):
-        for particle in self.particles[:]:
-            particle.update()
-            particle.draw(screen)
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
+        self.engine.update_and_draw(screen)
+
+def benchmark_particles(counts=(1000, 10000, 50000), frames=120):
+    budget_ms = 1000 / FPS
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    for count in counts:
+        system = ParticleSystem(max_particles=count)
+        elapsed = 0.0
+        for _ in range(frames):
+            # Refill to the cap each frame so every update runs saturated
+            while system.engine.free() > 0:
+                system.emit(0, 0, WIDTH, HEIGHT)
+            start = time.perf_counter()
+            system.update_and_draw(surface)
+            elapsed += time.perf_counter() - start
+        frame_ms = elapsed / frames * 1000
+        print(f"particles {count:>6}: {frame_ms:7.2f} ms/frame   "
+              f"{'within' if frame_ms <= budget_ms else 'over'} the {budget_ms:.1f} ms frame budget")
+
+# Fonts are kept per size; rendered strings are kept in a bounded LRU cache
+TEXT_CACHE_SIZE = 256
+font_cache = {}
+text_cache = OrderedDict()
+
+def get_font(size):
+    font = font_cache.get(size)
+    if font is None:
+        font = pygame.font.Font(None, size)
+        font_cache[size] = font
+    return font
+
+def render_text(text, size, color, outline_color=None):
+    key = (text, size, color, outline_color)
+    text_surface = text_cache.get(key)
+    if text_surface is not None:
+        text_cache.move_to_end(key)
+        return text_surface
+
+    text_surface = get_font(size).render(text, True, color)
+    if outline_color is not None:
+        # Text rendered over a larger font in the outline color, both centered
+        outline_surface = get_font(size + 4).render(text, True, outline_color)
+        width = max(outline_surface.get_width(), text_surface.get_width())
+        height = max(outline_surface.get_height(), text_surface.get_height())
+        combined = pygame.Surface((width, height), pygame.SRCALPHA)
+        combined.blit(outline_surface, (width // 2 - outline_surface.get_width() // 2, height // 2 - outline_surface.get_height() // 2))
+        combined.blit(text_surface, (width // 2 - text_surface.get_width() // 2, height // 2 - text_surface.get_height() // 2))
+        text_surface = combined
+
+    text_cache[key] = text_surface
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return text_surface
 
 def draw_text(text, size, x, y):
-    font = pygame.font.Font(None, size)
-    text_surface = font.render(text, True, (0, 0, 0)) 
+    text_surface = render_text(text, size, (0, 0, 0))
     text_rect = text_surface.get_rect()
     text_rect.center = (x, y)
     screen.blit(text_surface, text_rect)
 
 def draw_text_options(text, size, x, y, text_color=(90, 216, 168), outline_color=(0, 0, 0)):
-    font = pygame.font.Font(None, size + 4)  # Larger font size for the outline
-    text_surface = font.render(text, True, outline_color)  # Render with outline color
+    text_surface = render_text(text, size, text_color, outline_color)
     text_rect = text_surface.get_rect()
     text_rect.center = (x, y)
     screen.blit(text_surface, text_rect)
 
-    font = pygame.font.Font(None, size)
-    text_surface = font.render(text, True, text_color)  # Render with custom text color
-    text_rect = text_surface.get_rect()
-    text_rect.center = (x, y)
-    screen.blit(text_surface, text_rect)
-    
 
 # Define initial control mappings
 controls = {
@@ -398,31 +1937,181 @@ def update_controls(new_controls):
     global controls
     controls = new_controls
 
-def play_main_menu_music():
-    pygame.mixer.music.stop()
-    pygame.mixer.music.unload()
-    pygame.mixer.music.load(os.path.join('assets', 'music1.wav'))
-    pygame.mixer.music.play(loops=-1)
+# Background music: one playlist at a time on pygame.mixer.music. The next track is
+# queued while the current one plays and the end event queues the one after, so
+# nothing polls the mixer; pausing keeps the track loaded instead of reloading it.
+MUSIC_END_EVENT = pygame.USEREVENT + 1
+
+class MusicScheduler:
+    def __init__(self, playlists):
+        self.playlists = playlists
+        self.validated = False
+        self.wanted = None  # Playlist that should be playing
+        self.playing = None  # Playlist loaded into the mixer
+        self.track = None
+        self.queued = None
+        self.paused = False
+
+    def validate(self):
+        # Checks every track once and drops the missing ones
+        for name, tracks in self.playlists.items():
+            found = [track for track in tracks if os.path.isfile(track)]
+            for track in tracks:
+                if track not in found:
+                    print(f"Music track not found, skipping: {track}")
+            self.playlists[name] = found
+        self.validated = True
+
+    def play(self, name):
+        self.wanted = name
+        self.update()
 
-def stop_main_menu_music():
-    pygame.mixer.music.stop()
+    def update(self):
+        # Cheap enough to call every frame; starts the wanted playlist once audio is up
+        if self.wanted == self.playing or not audio_ready.is_set():
+            return
+        if not self.validated:
+            self.validate()
+            pygame.mixer.music.set_endevent(MUSIC_END_EVENT)
+        self.halt()
+        self.playing = self.wanted
+        tracks = self.playlists.get(self.playing) or []
+        if not tracks:
+            return
+        self.track = random.choice(tracks)
+        pygame.mixer.music.load(self.track)
+        if len(tracks) == 1:
+            pygame.mixer.music.play(loops=-1)
+        else:
+            pygame.mixer.music.play()
+            self.queue_next()
 
-def play_random_game_music():
-    global current_game_track
-    if current_game_track is not None:
-        pygame.mixer.music.unload()
-    current_game_track = random.choice(game_music_tracks)
-    pygame.mixer.music.load(current_game_track)
-    pygame.mixer.music.play()
+    def queue_next(self):
+        tracks = [track for track in self.playlists[self.playing] if track != self.track]
+        self.queued = random.choice(tracks)
+        pygame.mixer.music.queue(self.queued)
 
-def stop_game_music():
-    pygame.mixer.music.stop()
-    pygame.mixer.music.unload()
+    def track_ended(self):
+        # MUSIC_END_EVENT: the queued track has taken over, so queue the one after it
+        if self.queued is None or self.paused:
+            return
+        if pygame.mixer.music.get_busy():
+            self.track = self.queued
+            self.queue_next()
+        else:
+            self.playing = None  # Ran dry, start the playlist again
+            self.update()
 
+    def pause(self):
+        if self.playing is not None and not self.paused:
+            pygame.mixer.music.pause()
+            self.paused = True
+
+    def unpause(self):
+        if self.paused:
+            pygame.mixer.music.unpause()
+            self.paused = False
+
+    def stop(self):
+        self.wanted = None
+        self.halt()
+
+    def halt(self):
+        if self.playing is not None:
+            pygame.mixer.music.stop()
+            pygame.mixer.music.unload()
+            pygame.event.clear(MUSIC_END_EVENT)  # stop() posts one, it is not a track change
+        self.playing = self.track = self.queued = None
+        self.paused = False
+
+music = MusicScheduler({'menu': menu_music_tracks, 'game': game_music_tracks})
 
-def main_menu(particle_system):
-    play_main_menu_music()
 
+# Menus are scenes: a static layer cached until its key changes, the parts that
+# change drawn on top, and no redraw at all while nothing changed or animates
+MENU_IDLE_WAIT = 250  # ms an idle menu blocks in pygame.event.wait()
+
+class MenuScene:
+    def __init__(self):
+        self.static_layer = None
+        self.static_key = None
+        self.drawn_state = None
+        self.frames_drawn = 0
+
+    def static_state(self):
+        # Everything draw_static depends on
+        return None
+
+    def state(self):
+        # Everything the frame depends on; the scene is redrawn when it changes
+        return None
+
+    def animating(self):
+        return False
+
+    def draw_static(self):
+        pass
+
+    def draw_dynamic(self):
+        pass
+
+    def handle_event(self, event):
+        # Return a result to leave the scene
+        return None
+
+    def update(self):
+        return None
+
+    def presented(self):
+        return None
+
+    def invalidate(self):
+        # Call after another scene drew over the screen
+        self.drawn_state = None
+
+    def redraw(self):
+        key = self.static_state()
+        if self.static_layer is None or key != self.static_key:
+            self.draw_static()
+            self.static_layer = screen.copy()
+            self.static_key = key
+        else:
+            screen.blit(self.static_layer, (0, 0))
+        self.draw_dynamic()
+        pygame.display.flip()
+        self.frames_drawn += 1
+
+    def run(self):
+        while True:
+            if self.animating():
+                events = pygame.event.get()
+            else:
+                events = [pygame.event.wait(MENU_IDLE_WAIT)] + pygame.event.get()
+            for event in events:
+                result = self.handle_event(event)
+                if result is not None:
+                    return result
+
+            result = self.update()
+            if result is not None:
+                return result
+            memory.frame()
+            state = self.state()
+            if self.animating() or state != self.drawn_state:
+                self.redraw()
+                self.drawn_state = state
+                result = self.presented()
+                if result is not None:
+                    return result
+            clock.tick(FPS)
+
+def play_menu_sound(name, what):
+    try:
+        assets.sound(name).play()
+    except pygame.error as e:
+        print(f"Error playing {what} sound: {e}")
+
+class MainMenuScene(MenuScene):
     # Define button colors
     button_color = (39, 157, 123)    # #279d7b
     hover_color = (51, 206, 161)     # #33cea1
@@ -432,318 +2121,1578 @@ def main_menu(particle_system):
     button_height = 50
     button_margin = 20  # Space between buttons
 
-    # Calculate total width required for buttons
-    total_width = 3 * button_width + 2 * button_margin
-    start_x = (WIDTH - total_width) // 2  # Start drawing buttons from this x-coordinate
-    start_y = HEIGHT // 2 + 200  
-
-    buttons = [
-        pygame.Rect(start_x, start_y, button_width, button_height),
-        pygame.Rect(start_x + button_width + button_margin, start_y, button_width, button_height),
-        pygame.Rect(start_x + 2 * (button_width + button_margin), start_y, button_width, button_height)
-    ]
-
     button_texts = ["Play", "Options", "Quit"]
 
-    hovered_button = None  # Variable to track currently hovered button
-    selected_button = 0
-    menu_particles = []
-    while True:
+    def __init__(self, particle_system):
+        super().__init__()
+        self.particle_system = particle_system
+        music.play('menu')
+        self.background_image = assets.image('mainmenu.png', alpha=False)
+        self.first_frame = True
+
+        # Calculate total width required for buttons
+        total_width = 3 * self.button_width + 2 * self.button_margin
+        start_x = (WIDTH - total_width) // 2  # Start drawing buttons from this x-coordinate
+        start_y = HEIGHT // 2 + 200
+        self.buttons = [
+            pygame.Rect(start_x + i * (self.button_width + self.button_margin), start_y, self.button_width, self.button_height)
+            for i in range(3)
+        ]
+
+        self.hovered_button = None  # Index of the currently hovered button
+        self.mouse_pos = (0, 0)
+        self.menu_particles = ParticleEngine(MENU_PARTICLE_LIMIT, MENU_PARTICLE_COLORS)
+
+    def animating(self):
+        return True  # Menu particles keep rising while the menu is open
+
+    def draw_button(self, i, color):
+        button = self.buttons[i]
+        pygame.draw.rect(screen, color, button)
+        draw_text(self.button_texts[i], 40, button.centerx, button.centery)
+
+    def draw_static(self):
         screen.fill((255, 255, 255))
-        screen.blit(background_image, (0, 0))  # Draw background image
-
-        mouse_x, mouse_y = pygame.mouse.get_pos()
-
-        for i, button in enumerate(buttons):
-            if button.collidepoint(mouse_x, mouse_y):
-                if hovered_button != button:  # If mouse enters new button area
-                    hovered_button = button
-                    try:
-                        hover_sound.play()
-                    except pygame.error as e:
-                        print(f"Error playing hover sound: {e}")
-                pygame.draw.rect(screen, hover_color, button)
-            else:
-                pygame.draw.rect(screen, button_color, button)
-                if hovered_button == button:  # If mouse leaves previous button area
-                    hovered_button = None  # Reset hovered button
-                    hover_sound.stop()
-
-            draw_text(button_texts[i], 40, button.centerx, button.centery)
+        screen.blit(self.background_image, (0, 0))  # Draw background image
+        for i in range(len(self.buttons)):
+            self.draw_button(i, self.button_color)
 
-            # Handle particle emission on button hover
-            if button.collidepoint(mouse_x, mouse_y):
-                particle_system.emit(button.x, button.y, button.width, button.height)
+    def draw_dynamic(self):
+        if self.hovered_button is not None:
+            self.draw_button(self.hovered_button, self.hover_color)
+        self.menu_particles.update_and_draw(screen)
+        self.particle_system.update_and_draw(screen)  # Update and draw particles
 
-        for particle in menu_particles[:]:
-            particle.update()
-            particle.draw(screen)
-            if particle.lifetime <= 0:
-                menu_particles.remove(particle)
+    def update(self):
+        music.update()
+
+        self.mouse_pos = pygame.mouse.get_pos()
+        hovered = None
+        for i, button in enumerate(self.buttons):
+            if button.collidepoint(self.mouse_pos):
+                hovered = i
+                # Handle particle emission on button hover
+                self.particle_system.emit(button.x, button.y, button.width, button.height)
+        if hovered != self.hovered_button:
+            if self.hovered_button is not None:  # If mouse leaves previous button area
+                assets.sound('hover.wav').stop()
+            if hovered is not None:  # If mouse enters new button area
+                play_menu_sound('hover.wav', 'hover')
+            self.hovered_button = hovered
 
         # Emit new menu particles periodically
         if random.random() < 0.4:  # Adjust emission rate as needed
-            x = random.randint(0, WIDTH)
-            y = HEIGHT
-            particle = MenuParticle(x, y)
-            menu_particles.append(particle)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return "quit"
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                for i, button in enumerate(buttons):
-                    if button.collidepoint(mouse_x, mouse_y):
-                        if i == 0:
-                            try:
-                                select_sound.play()  # Play select sound on button click
-                            except pygame.error as e:
-                                print(f"Error playing select sound: {e}")
-                            return "play"
-                        elif i == 1:
-                            try:
-                                select_sound.play()  # Play select sound on button click
-                            except pygame.error as e:
-                                print(f"Error playing select sound: {e}")
-                            options_menu()  # Navigate to options menu
-                        elif i == 2:
-                            pygame.quit()
-                            return "quit"
+            spawn_menu_particle(self.menu_particles, random.randint(0, WIDTH), HEIGHT)
 
-        particle_system.update_and_draw(screen)  # Update and draw particles
-
-        pygame.display.flip()
-        clock.tick(FPS)
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            return "quit"
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            for i, button in enumerate(self.buttons):
+                if button.collidepoint(event.pos):
+                    if i == 0:
+                        play_menu_sound('select.wav', 'select')  # Play select sound on button click
+                        return "play"
+                    elif i == 1:
+                        play_menu_sound('select.wav', 'select')  # Play select sound on button click
+                        if options_menu() == "quit":  # Navigate to options menu
+                            return "quit"
+                        self.invalidate()
+                    elif i == 2:
+                        pygame.quit()
+                        return "quit"
+        return None
+
+    def presented(self):
+        if self.first_frame:
+            self.first_frame = False
+            if exit_after_first_frame:
+                report_startup_and_quit()
+                return "quit"
+        return None
 
+def main_menu(particle_system):
+    memory.enter('main_menu')
+    return MainMenuScene(particle_system).run()
 
-def options_menu():
-    global controls, VOLUME, all_sounds
-    running = True
-    selected_option = 0
-    awaiting_keypress = False
-    options = ['up', 'down', 'left', 'right', 'volume']
-
-    background_image = pygame.image.load(os.path.join('assets', 'optionmenu.png')).convert()
-    hover_sound_options = pygame.mixer.Sound(os.path.join('assets', 'hover2.wav'))
-    select_sound = pygame.mixer.Sound(os.path.join('assets', 'select.wav'))
-    select2_sound = pygame.mixer.Sound(os.path.join('assets', 'select2.wav'))
-
-    all_sounds.extend([hover_sound_options, select_sound, select2_sound])
-    for sound in [hover_sound_options, select_sound, select2_sound]:
-        sound.set_volume(VOLUME)
 
+class OptionsMenuScene(MenuScene):
+    options = ['up', 'down', 'left', 'right', 'volume', 'quality']
     text_color = (255, 255, 255)
     highlight_color = (90, 216, 168)
-    update_volume()
 
-    while running:
-        screen.blit(background_image, (0, 0))
+    def __init__(self):
+        super().__init__()
+        self.selected_option = 0
+        self.awaiting_keypress = False
+
+        self.background_image = assets.image('optionmenu.png', alpha=False)
+        self.hover_sound_options = assets.sound('hover2.wav')
+        self.select_sound = assets.sound('select.wav')
+        self.select2_sound = assets.sound('select2.wav')
+        self.back_sound = assets.sound('back.wav')
+
+    def state(self):
+        return (self.selected_option, self.awaiting_keypress, tuple(controls.values()), VOLUME, RENDER_SCALE)
+
+    def draw_static(self):
+        screen.blit(self.background_image, (0, 0))
+        draw_text_options("Press ESC to go back", 24, WIDTH // 2, HEIGHT - 100, text_color=self.text_color, outline_color=(0, 0, 0))
 
-        for i, option in enumerate(options):
+    def draw_dynamic(self):
+        for i, option in enumerate(self.options):
             if option == 'volume':
                 text = f"Volume: {int(VOLUME * 100)}%"
+            elif option == 'quality':
+                text = f"Quality: {render_quality_name()} ({int(RENDER_SCALE * 100)}%)"
             else:
                 text = f"Move {option.capitalize()}: {pygame.key.name(controls[option])}"
 
             y_position = HEIGHT // 2 - 100 + i * 50  # Adjust this value to move options higher or lower
-            if selected_option == i:
-                if awaiting_keypress and option != 'volume':
+            if self.selected_option == i:
+                if self.awaiting_keypress and option in controls:
                     text = f"Move {option.capitalize()}: Press a key..."
-                draw_text_options(text, 36, WIDTH // 2, y_position, text_color=highlight_color, outline_color=(0, 0, 0))
+                draw_text_options(text, 36, WIDTH // 2, y_position, text_color=self.highlight_color, outline_color=(0, 0, 0))
             else:
-                draw_text_options(text, 36, WIDTH // 2, y_position, text_color=text_color, outline_color=(0, 0, 0))
-
-        draw_text_options("Press ESC to go back", 24, WIDTH // 2, HEIGHT - 100, text_color=text_color, outline_color=(0, 0, 0))
-
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    back_sound.play()  # Play back sound
-                    running = False
-                elif awaiting_keypress and selected_option != 4:
-                    controls[options[selected_option]] = event.key
-                    select2_sound.play()
-                    awaiting_keypress = False
-                else:
-                    if event.key == pygame.K_UP:
-                        selected_option = (selected_option - 1) % len(options)
-                        hover_sound_options.play()
-                    elif event.key == pygame.K_DOWN:
-                        selected_option = (selected_option + 1) % len(options)
-                        hover_sound_options.play()
-                    elif event.key == pygame.K_RETURN:
-                        if selected_option != 4:  # Not volume
-                            awaiting_keypress = True
-                            select_sound.play()
-                    elif event.key == pygame.K_LEFT and selected_option == 4:
-                        VOLUME = max(0, VOLUME - 0.1)
-                        update_volume()
-                        select_sound.play()
-                    elif event.key == pygame.K_RIGHT and selected_option == 4:
-                        VOLUME = min(1, VOLUME + 0.1)
-                        update_volume()
-                        select_sound.play()
-
-            elif event.type == pygame.QUIT:
-                pygame.quit()
-                return "quit"
+                draw_text_options(text, 36, WIDTH // 2, y_position, text_color=self.text_color, outline_color=(0, 0, 0))
+
+    def handle_event(self, event):
+        global VOLUME, RENDER_SCALE
+        option = self.options[self.selected_option]
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                self.back_sound.play()  # Play back sound
+                return "resume"
+            elif self.awaiting_keypress and option in controls:
+                controls[option] = event.key
+                self.select2_sound.play()
+                self.awaiting_keypress = False
+            else:
+                if event.key == pygame.K_UP:
+                    self.selected_option = (self.selected_option - 1) % len(self.options)
+                    self.hover_sound_options.play()
+                elif event.key == pygame.K_DOWN:
+                    self.selected_option = (self.selected_option + 1) % len(self.options)
+                    self.hover_sound_options.play()
+                elif event.key == pygame.K_RETURN:
+                    if option in controls:  # Not volume or quality
+                        self.awaiting_keypress = True
+                        self.select_sound.play()
+                elif event.key == pygame.K_LEFT and option == 'volume':
+                    VOLUME = max(0, VOLUME - 0.1)
+                    update_volume()
+                    self.select_sound.play()
+                elif event.key == pygame.K_RIGHT and option == 'volume':
+                    VOLUME = min(1, VOLUME + 0.1)
+                    update_volume()
+                    self.select_sound.play()
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT) and option == 'quality':
+                    step = 1 if event.key == pygame.K_RIGHT else -1
+                    scales = [scale for _, scale in RENDER_QUALITY_PRESETS]
+                    index = scales.index(RENDER_SCALE) if RENDER_SCALE in scales else len(scales) - 1
+                    RENDER_SCALE = scales[max(0, min(len(scales) - 1, index + step))]
+                    self.select_sound.play()
+
+        elif event.type == pygame.QUIT:
+            pygame.quit()
+            return "quit"
+        return None
 
+def options_menu():
+    previous = memory.enter('options')
     update_volume()
-    return "resume"
-
-
+    result = OptionsMenuScene().run()
+    if result != "quit":
+        update_volume()
+    memory.enter(previous)
+    return result
 
 
 def update_volume():
-    global all_sounds
-    pygame.mixer.music.set_volume(VOLUME)
-    for sound in all_sounds:
+    if audio_ready.is_set():
+        pygame.mixer.music.set_volume(VOLUME)
+    for sound in assets.all_sounds():
         sound.set_volume(VOLUME)
 
-def pause_menu():
-    global controls, VOLUME, all_sounds
 
-    running = True
-    selected_option = 0  # Track the currently selected option (0 for resume)
+class PauseMenuScene(MenuScene):
+    options = ["Resume", "Options", "Main Menu"]
 
-    # Load sounds
-    hover_sound_pause = pygame.mixer.Sound(os.path.join('assets', 'hover2.wav'))
-    select_sound_pause = pygame.mixer.Sound(os.path.join('assets', 'select.wav'))
+    def __init__(self):
+        super().__init__()
+        self.selected_option = 0  # Track the currently selected option (0 for resume)
+        self.previous_selected_option = None  # To track the previously selected option
 
-    all_sounds.extend([hover_sound_pause, select_sound_pause])
-    for sound in [hover_sound_pause, select_sound_pause]:
-        sound.set_volume(VOLUME)
+        self.hover_sound_pause = assets.sound('hover2.wav')
+        self.select_sound_pause = assets.sound('select.wav')
+        self.back_sound = assets.sound('back.wav')
 
-    previous_selected_option = None  # To track the previously selected option
+    def state(self):
+        return self.selected_option
 
-    while running:
+    def draw_static(self):
         screen.fill((0, 0, 0, 180))  # Semi-transparent black overlay
-
         draw_text_options("Paused", 60, WIDTH // 2, HEIGHT // 4, text_color=(90, 216, 168), outline_color=(0, 0, 0))
 
-        options = ["Resume", "Options", "Main Menu"]
-        for i, option in enumerate(options):
-            if selected_option == i:
+    def draw_dynamic(self):
+        for i, option in enumerate(self.options):
+            if self.selected_option == i:
                 draw_text_options(option, 36, WIDTH // 2, HEIGHT // 2 + i * 50, text_color=(90, 216, 168), outline_color=(0, 0, 0))
             else:
                 draw_text_options(option, 36, WIDTH // 2, HEIGHT // 2 + i * 50, text_color=(200, 200, 200), outline_color=(0, 0, 0))
 
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    back_sound.play()  # Play back sound
-                    select_sound_pause.play()
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                self.back_sound.play()  # Play back sound
+                self.select_sound_pause.play()
+                return "resume"
+            elif event.key == pygame.K_RETURN:
+                self.select_sound_pause.play()
+                if self.selected_option == 0:
                     return "resume"
-                elif event.key == pygame.K_RETURN:
-                    select_sound_pause.play()
-                    if selected_option == 0:
-                        return "resume"
-                    elif selected_option == 1:
-                        options_menu()
-                    elif selected_option == 2:
-                        stop_game_music()
-                        return "main_menu"
-                elif event.key == pygame.K_UP:
-                    selected_option = (selected_option - 1) % len(options)
-                elif event.key == pygame.K_DOWN:
-                    selected_option = (selected_option + 1) % len(options)
-
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_x, mouse_y = pygame.mouse.get_pos()
-                for i, option in enumerate(options):
-                    if HEIGHT // 2 + i * 50 - 18 < mouse_y < HEIGHT // 2 + i * 50 + 18:
-                        selected_option = i
-                        select_sound_pause.play()
-
-            elif event.type == pygame.QUIT:
-                pygame.quit()
-                return "quit"
+                elif self.selected_option == 1:
+                    if options_menu() == "quit":
+                        return "quit"
+                    self.invalidate()
+                elif self.selected_option == 2:
+                    music.stop()
+                    return "main_menu"
+            elif event.key == pygame.K_UP:
+                self.selected_option = (self.selected_option - 1) % len(self.options)
+            elif event.key == pygame.K_DOWN:
+                self.selected_option = (self.selected_option + 1) % len(self.options)
+
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            mouse_x, mouse_y = pygame.mouse.get_pos()
+            for i, option in enumerate(self.options):
+                if HEIGHT // 2 + i * 50 - 18 < mouse_y < HEIGHT // 2 + i * 50 + 18:
+                    self.selected_option = i
+                    self.select_sound_pause.play()
+
+        elif event.type == pygame.QUIT:
+            pygame.quit()
+            return "quit"
+        return None
 
+    def update(self):
         # Play hover sound when the selection changes
-        if previous_selected_option is not None and previous_selected_option != selected_option:
-            hover_sound_pause.play()
+        if self.previous_selected_option is not None and self.previous_selected_option != self.selected_option:
+            self.hover_sound_pause.play()
+        self.previous_selected_option = self.selected_option
+        return None
+
+def pause_menu():
+    previous = memory.enter('pause')
+    result = PauseMenuScene().run()
+    memory.enter(previous)
+    return result
+
+
+def benchmark_menus(seconds=2.0):
+    # Leaves each idle menu open with no input, then reports how busy it kept the process
+    for name, scene in (('pause', PauseMenuScene), ('options', OptionsMenuScene)):
+        menu = scene()
+        timer = threading.Timer(seconds, pygame.event.post,
+                                [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_ESCAPE, mod=0, unicode='', scancode=0)])
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        timer.start()
+        menu.run()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        print(f"menu {name:>8}: {cpu / wall * 100:5.1f}% CPU idle   {menu.frames_drawn} frames drawn in {wall:.1f} s")
+
+    menu = MainMenuScene(ParticleSystem())
+    timer = threading.Timer(seconds, pygame.event.post, [pygame.event.Event(pygame.QUIT)])
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    timer.start()
+    menu.handle_event = lambda event: "quit" if event.type == pygame.QUIT else None  # Keep the display open
+    menu.run()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    print(f"menu {'main':>8}: {cpu / wall * 100:5.1f}% CPU animating   {menu.frames_drawn / wall:.0f} fps")
+
+
+# Opt-in per-frame stage timing. F3 toggles recording and the overlay in game;
+# --profile-csv streams every recorded frame to a CSV file.
+PROFILE_STAGES = ('events', 'update', 'maze', 'entities', 'player', 'fog', 'overlay', 'flip', 'tick')
+PROFILE_FRAMES = 240  # Ring buffer length
+PROFILE_OVERLAY_REFRESH = 15  # Frames between overlay text updates
+
+class FrameProfiler:
+    def __init__(self, stages=PROFILE_STAGES, frames=PROFILE_FRAMES):
+        self.enabled = False
+        self.stages = stages
+        self.frames = frames
+        self.samples = {stage: array('d', bytes(8 * frames)) for stage in stages}
+        self.skipped = array('B', bytes(frames))  # 1 where FramePresenter found nothing to redraw
+        self.frame = 0
+        self.last = 0.0
+        self.csv_file = None
+        self.csv_writer = None
+        self.font = None
+        self.overlay_surface = None
+        self.overlay_version = 0  # Bumped on every re-render, the FramePresenter region key
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.overlay_surface = None
+
+    def begin_frame(self):
+        if self.enabled:
+            slot = self.frame % self.frames
+            for stage in self.stages:
+                self.samples[stage][slot] = 0.0
+            self.skipped[slot] = 0
+            self.last = time.perf_counter()
+
+    def mark(self, stage):
+        # Charges the time since the previous mark to stage
+        if self.enabled:
+            now = time.perf_counter()
+            self.samples[stage][self.frame % self.frames] += now - self.last
+            self.last = now
+
+    def presented(self, dirty_rects):
+        # Records whether the frame had anything to redraw, from FramePresenter.dirty_rects()
+        if self.enabled:
+            self.skipped[self.frame % self.frames] = dirty_rects == []
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        if self.csv_writer is not None:
+            slot = self.frame % self.frames
+            self.csv_writer.writerow([self.frame] + [f"{self.samples[stage][slot] * 1000:.4f}" for stage in self.stages]
+                                     + [self.skipped[slot]])
+        self.frame += 1
+        if self.frame % PROFILE_OVERLAY_REFRESH == 0:
+            self.overlay_surface = None  # Re-rendered once, by the next frame that shows it
+
+    def stats(self):
+        # (stage, rolling average ms, p99 ms) over the frames in the ring buffer
+        count = min(self.frame, self.frames)
+        if count == 0:
+            return []
+        rows = []
+        for stage in self.stages:
+            recent = sorted(self.samples[stage][:count])
+            rows.append((stage, sum(recent) / count * 1000, percentile(recent, 0.99) * 1000))
+        return rows
+
+    def draw(self, surface):
+        if not self.enabled:
+            return
+        surface.blit(self.refresh_overlay(), (10, 10))
+
+    def refresh_overlay(self):
+        if self.overlay_surface is None:
+            self.overlay_surface = self.render_overlay()
+            self.overlay_version += 1
+        return self.overlay_surface
+
+    def overlay_region(self):
+        # (screen rect, key) for FramePresenter; the key changes whenever the overlay is re-rendered
+        overlay = self.refresh_overlay()
+        return overlay.get_rect(topleft=(10, 10)), self.overlay_version
+
+    def render_overlay(self):
+        if self.font is None:
+            self.font = get_font(20)
+        rows = self.stats()
+        total = sum(average for _, average, _ in rows)
+        lines = [f"{'stage':<8} {'avg ms':>7} {'p99 ms':>7}"]
+        lines += [f"{stage:<8} {average:7.2f} {p99:7.2f}" for stage, average, p99 in rows]
+        lines.append(f"{'frame':<8} {total:7.2f}")
+        count = min(self.frame, self.frames)
+        lines.append(f"{'skipped':<8} {sum(self.skipped[:count]):7d} of {count}")
+
+        line_height = self.font.get_linesize()
+        overlay = pygame.Surface((200, line_height * len(lines) + 8), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            overlay.blit(self.font.render(line, True, (90, 216, 168)), (6, 4 + i * line_height))
+        return overlay
+
+    def start_csv(self, path):
+        self.csv_file = open(path, 'w', newline='')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(['frame'] + [f"{stage}_ms" for stage in self.stages] + ['skipped'])
+        self.enabled = True
+        atexit.register(self.close)
+
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
+
+profiler = FrameProfiler()
+
+# Opt-in allocation tracking (--memory). A tracemalloc snapshot is taken whenever a scene
+# is entered or left, and each scene visit reports what it kept allocated per frame and
+# the sites that kept the most. The traced size each time the game comes back to the
+# main menu is watched too, so steady growth across menu/game cycles is flagged as a leak.
+MEMORY_TOP_SITES = 5
+MEMORY_WARMUP_CYCLES = 1  # Cycles that fill caches and are not checked for growth
+MEMORY_GROWTH_CYCLES = 3
+# Growth in this many cycles in a row is flagged if it adds up to at least this much.
+# Surface pixels and Sound samples live in SDL, out of tracemalloc's sight, so live
+# Surface and Sound objects are counted and sized separately.
+MEMORY_GROWTH_MIN = {'traced bytes': 64 * 1024, 'traced blocks': 500, 'surfaces': 1, 'surface bytes': 64 * 1024,
+                     'sounds': 1, 'sound bytes': 64 * 1024}
+MEMORY_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+                  tracemalloc.Filter(False, '<unknown>')]
+
+def live_media_sizes():
+    # Surfaces and Sounds are not tracked by gc, so they are found through the containers
+    # that are, looking inside tuples that gc has stopped tracking as well
+    found = {}
+    seen = set()
+    pending = gc.get_objects()
+    while pending:
+        referents = gc.get_referents(*pending)
+        pending = []
+        for obj in referents:
+            if isinstance(obj, (pygame.Surface, pygame.mixer.Sound)):
+                found[id(obj)] = obj
+            elif type(obj) is tuple and not gc.is_tracked(obj) and id(obj) not in seen:
+                seen.add(id(obj))
+                pending.append(obj)
+    surfaces = [obj for obj in found.values() if isinstance(obj, pygame.Surface)]
+    sounds = [obj for obj in found.values() if isinstance(obj, pygame.mixer.Sound)]
+    return {'surfaces': len(surfaces), 'surface bytes': sum(surface.get_pitch() * surface.get_height() for surface in surfaces),
+            'sounds': len(sounds), 'sound bytes': sum(len(sound.get_raw()) for sound in sounds)}
+
+def format_memory_metric(name, value, sign=''):
+    if name.endswith('bytes'):
+        return f"{name} {value / 1024:{sign}.1f} KB"
+    return f"{name} {value:{sign}d}"
+
+class MemoryTracker:
+    def __init__(self):
+        self.enabled = False
+        self.scene = None
+        self.snapshot = None
+        self.start_size = 0
+        self.frames = 0
+        self.cycles = 0
+        self.cycle_snapshots = deque(maxlen=MEMORY_GROWTH_CYCLES + 1)
+        self.leaks = []
+
+    def start(self):
+        self.enabled = True
+        tracemalloc.start()
+        atexit.register(self.finish)
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+
+    def enter(self, scene):
+        # Closes the report for the scene being left; returns its name so callers can go back
+        previous = self.scene
+        if not self.enabled:
+            return previous
+        snapshot = self.take_snapshot()
+        if previous is not None:
+            self.report(snapshot)
+        self.scene, self.snapshot, self.frames = scene, snapshot, 0
+        tracemalloc.reset_peak()
+        self.start_size = tracemalloc.get_traced_memory()[0]
+        return previous
+
+    def frame(self):
+        if self.enabled:
+            self.frames += 1
+
+    def report(self, snapshot):
+        stats = snapshot.compare_to(self.snapshot, 'lineno')
+        size = sum(stat.size_diff for stat in stats)
+        count = sum(stat.count_diff for stat in stats)
+        frames = max(self.frames, 1)
+        peak = tracemalloc.get_traced_memory()[1] - self.start_size
+        print(f"memory {self.scene:<10} {self.frames:5d} frames   {size / 1024:+9.1f} KB kept   "
+              f"{size / frames:+9.1f} B/frame   {count / frames:+7.2f} blocks/frame   peak {peak / 1024:+9.1f} KB")
+        self.print_sites(stats)
+
+    def print_sites(self, stats):
+        for stat in sorted(stats, key=lambda stat: -abs(stat.size_diff))[:MEMORY_TOP_SITES]:
+            if stat.size_diff:
+                frame = stat.traceback[0]
+                print(f"    {stat.size_diff / 1024:+9.1f} KB {stat.count_diff:+7d} blocks   "
+                      f"{os.path.basename(frame.filename)}:{frame.lineno}")
+
+    def cycle(self):
+        # Call each time the main menu comes back: checks every cycle metric for steady growth
+        if not self.enabled:
+            return
+        self.cycles += 1
+        if self.cycles <= MEMORY_WARMUP_CYCLES:
+            return
+        gc.collect()
+        snapshot = self.take_snapshot()
+        # Sized from the filtered snapshot, which leaves out the snapshots kept here
+        stats = snapshot.statistics('filename')
+        metrics = {'traced bytes': sum(stat.size for stat in stats), 'traced blocks': sum(stat.count for stat in stats)}
+        metrics.update(live_media_sizes())
+        self.cycle_snapshots.append((metrics, snapshot))
+        print(f"memory cycle {self.cycles}: " + "   ".join(format_memory_metric(name, value) for name, value in metrics.items()))
+
+        if len(self.cycle_snapshots) < self.cycle_snapshots.maxlen:
+            return
+        grown = []
+        for name, minimum in MEMORY_GROWTH_MIN.items():
+            values = [metrics[name] for metrics, _ in self.cycle_snapshots]
+            if all(a < b for a, b in zip(values, values[1:])) and values[-1] - values[0] >= minimum:
+                grown.append((name, values[-1] - values[0]))
+        if grown:
+            self.leaks.append((self.cycles, grown))
+            print(f"memory LEAK? grew {MEMORY_GROWTH_CYCLES} cycles in a row by cycle {self.cycles}: "
+                  + ", ".join(format_memory_metric(name, growth, '+') for name, growth in grown))
+            self.print_sites(self.cycle_snapshots[-1][1].compare_to(self.cycle_snapshots[0][1], 'lineno'))
+
+    def finish(self):
+        if not self.enabled:
+            return
+        if self.scene is not None:
+            self.report(self.take_snapshot())
+            self.scene = None
+        verdict = f"{len(self.leaks)} growth warnings" if self.leaks else "no steady growth"
+        print(f"memory: {self.cycles} menu/game cycles, {verdict}, "
+              f"{tracemalloc.get_traced_memory()[0] / 1024:.1f} KB traced at exit")
+        tracemalloc.stop()
+        self.enabled = False
+
+memory = MemoryTracker()
+
+# Scripted input for benchmark_memory(): (scene, delay in seconds, event) per step. A step
+# waits for its scene, so events are never eaten by the scene before it.
+def memory_cycle_script():
+    key = lambda key: pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode='', scancode=0)
+    play = MainMenuScene.button_width // 2 + (WIDTH - 3 * MainMenuScene.button_width - 2 * MainMenuScene.button_margin) // 2
+    return [('main_menu', 0.3, pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(play, HEIGHT // 2 + 225), button=1)),
+            ('game', 1.0, key(pygame.K_ESCAPE)),
+            ('pause', 0.1, key(pygame.K_DOWN)),
+            ('pause', 0.1, key(pygame.K_RETURN)),
+            ('options', 0.2, key(pygame.K_ESCAPE)),
+            ('pause', 0.1, key(pygame.K_DOWN)),
+            ('pause', 0.1, key(pygame.K_RETURN))]
+
+def benchmark_memory(cycles=6):
+    # Plays menu -> game -> pause -> options -> main menu cycles and fails on steady growth
+    script = memory_cycle_script() * cycles + [('main_menu', 0.3, pygame.event.Event(pygame.QUIT))]
+
+    def drive():
+        for scene, delay, event in script:
+            while memory.scene != scene:
+                time.sleep(0.01)
+            time.sleep(delay)
+            pygame.event.post(event)
+    memory.start()
+    threading.Thread(target=drive, daemon=True).start()
+    main()
+    leaks = len(memory.leaks)
+    memory.finish()
+    return 1 if leaks else 0
 
-        previous_selected_option = selected_option
+# Presentation: 'flip' redraws and flips the whole screen every frame, 'dirty' only
+# redraws and updates the regions that changed and skips frames where nothing did
+PRESENT_MODE = 'dirty'
 
-    return "resume"
+class FramePresenter:
+    def __init__(self):
+        self.state = None
+        self.regions = {}
+
+    def invalidate(self):
+        # Something else drew over the screen, so the next frame is redrawn in full
+        self.state = None
+        self.regions = {}
+
+    def dirty_rects(self, state, regions):
+        # state is everything the whole frame depends on (the camera), regions maps
+        # name -> (rect, key) for parts that change on their own. Returns None when
+        # the whole screen must be redrawn, otherwise the rects to redraw (maybe none)
+        previous = self.regions
+        self.regions = regions
+        if PRESENT_MODE != 'dirty' or state != self.state:
+            self.state = state
+            return None
+
+        rects = []
+        for name, (rect, key) in regions.items():
+            old = previous.get(name)
+            if old is None:
+                rects.append(rect)
+            elif old[0] != rect or old[1] != key:
+                rects.append(rect.union(old[0]))
+        rects += [rect for name, (rect, key) in previous.items() if name not in regions]
+        return rects
+
+# Minimap of explored cells. Exploration is kept as one bit per cell, in tiles of
+# MINIMAP_TILE_CELLS square so unbounded mazes work too, and each tile has a small
+# 8-bit surface that only newly revealed cells are painted into. Tile surfaces are
+# kept in an LRU and repainted from the bitmap if they are needed again.
+MINIMAP_TILE_CELLS = 64
+MINIMAP_CELL_PIXELS = 3
+MINIMAP_SIZE = 192  # Edge of the on-screen minimap in pixels
+MINIMAP_MAX_TILES = 64
+MINIMAP_PALETTE = [(0, 0, 0), (60, 60, 60), (170, 160, 140), BLUE]  # Unexplored, floor, wall, exit
+
+class Minimap:
+    def __init__(self, maze):
+        self.maze = maze
+        self.enabled = True
+        self.explored = {}  # (tile_x, tile_y) -> bytearray bitmap
+        self.tiles = OrderedDict()  # (tile_x, tile_y) -> painted surface
+        self.revealed = 0
+        self.center = None  # Cell the last reveal was centered on
+        self.rect = pygame.Rect(WIDTH - MINIMAP_SIZE - 10, 10, MINIMAP_SIZE, MINIMAP_SIZE)
+        self.background = None
+        # Cells whose centers are within VISIBILITY_RADIUS of the player's cell center
+        reach = VISIBILITY_RADIUS // CELL_SIZE
+        self.offsets = [(dx, dy) for dy in range(-reach, reach + 1) for dx in range(-reach, reach + 1)
+                        if (dx * dx + dy * dy) * CELL_SIZE * CELL_SIZE <= VISIBILITY_RADIUS * VISIBILITY_RADIUS]
+
+    def reveal_around(self, cell_x, cell_y):
+        # Only does work when the player enters a new cell, and only paints cells not seen before
+        if (cell_x, cell_y) == self.center:
+            return
+        self.center = (cell_x, cell_y)
+        width, height = self.maze.width, self.maze.height
+        size = MINIMAP_TILE_CELLS
+        for dx, dy in self.offsets:
+            x, y = cell_x + dx, cell_y + dy
+            if width is not None and not (0 <= x < width and 0 <= y < height):
+                continue
+            tile_key = (x // size, y // size)
+            bits = self.explored.get(tile_key)
+            if bits is None:
+                bits = self.explored[tile_key] = bytearray(size * size // 8)
+            i = (y % size) * size + x % size
+            if bits[i >> 3] >> (i & 7) & 1:
+                continue
+            bits[i >> 3] |= 1 << (i & 7)
+            self.revealed += 1
+            tile = self.tiles.get(tile_key)
+            if tile is not None:
+                self.paint_cell(tile, x, y)
+
+    def is_explored(self, cell_x, cell_y):
+        size = MINIMAP_TILE_CELLS
+        bits = self.explored.get((cell_x // size, cell_y // size))
+        if bits is None:
+            return False
+        i = (cell_y % size) * size + cell_x % size
+        return bits[i >> 3] >> (i & 7) & 1 == 1
+
+    def cell_color(self, x, y):
+        if self.maze.exit == (x, y):
+            return 3
+        return 2 if self.maze.is_wall_cell(x, y) else 1
+
+    def paint_cell(self, tile, x, y):
+        size = MINIMAP_TILE_CELLS
+        tile.fill(self.cell_color(x, y), ((x % size) * MINIMAP_CELL_PIXELS, (y % size) * MINIMAP_CELL_PIXELS,
+                                           MINIMAP_CELL_PIXELS, MINIMAP_CELL_PIXELS))
+
+    def tile_surface(self, tile_x, tile_y):
+        key = (tile_x, tile_y)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+
+        size = MINIMAP_TILE_CELLS
+        tile = pygame.Surface((size * MINIMAP_CELL_PIXELS, size * MINIMAP_CELL_PIXELS), depth=8)
+        tile.set_palette(MINIMAP_PALETTE)
+        tile.set_colorkey(0)
+        tile.fill(0)
+        bits = self.explored.get(key)
+        if bits is not None:
+            # Evicted earlier, or never drawn: repaint what the bitmap says was explored
+            for i in range(size * size):
+                if bits[i >> 3] >> (i & 7) & 1:
+                    self.paint_cell(tile, tile_x * size + i % size, tile_y * size + i // size)
+        self.tiles[key] = tile
+        if len(self.tiles) > MINIMAP_MAX_TILES:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def region(self):
+        # (screen rect, key) for FramePresenter
+        return self.rect, (self.center, self.revealed)
+
+    def draw(self, surface):
+        if not self.enabled or self.center is None:
+            return
+        if self.background is None:
+            self.background = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+            self.background.fill((0, 0, 0, 170))
+        surface.blit(self.background, self.rect)
+
+        # Window of cells around the player, blitted a tile at a time
+        size = MINIMAP_TILE_CELLS
+        tile_pixels = size * MINIMAP_CELL_PIXELS
+        span = MINIMAP_SIZE // MINIMAP_CELL_PIXELS
+        first_x, first_y = self.center[0] - span // 2, self.center[1] - span // 2
+        origin_x = self.rect.x - first_x * MINIMAP_CELL_PIXELS
+        origin_y = self.rect.y - first_y * MINIMAP_CELL_PIXELS
+        clip = surface.get_clip()
+        surface.set_clip(self.rect.clip(clip))
+        for tile_y in range(first_y // size, (first_y + span) // size + 1):
+            for tile_x in range(first_x // size, (first_x + span) // size + 1):
+                if (tile_x, tile_y) in self.explored:
+                    surface.blit(self.tile_surface(tile_x, tile_y),
+                                 (origin_x + tile_x * tile_pixels, origin_y + tile_y * tile_pixels))
+        surface.fill((255, 255, 255), (origin_x + self.center[0] * MINIMAP_CELL_PIXELS,
+                                       origin_y + self.center[1] * MINIMAP_CELL_PIXELS,
+                                       MINIMAP_CELL_PIXELS, MINIMAP_CELL_PIXELS))
+        surface.set_clip(clip)
+
+    def nbytes(self):
+        tile_pixels = MINIMAP_TILE_CELLS * MINIMAP_CELL_PIXELS
+        return len(self.explored) * MINIMAP_TILE_CELLS ** 2 // 8 + len(self.tiles) * tile_pixels * tile_pixels
+
+def benchmark_minimap(size=2001, seed=1):
+    # Walks the solution of a large maze, revealing as the game does, and compares the
+    # per-step cost with repainting the minimap window from the grid every frame
+    maze = Maze(size, size, seed=seed)
+    path = find_path(maze, (1, 1), maze.exit)
+    minimap = Minimap(maze)
+    target = pygame.Surface((WIDTH, HEIGHT))
+
+    steps = []
+    for cell in path:
+        start = time.perf_counter()
+        minimap.reveal_around(*cell)
+        minimap.draw(target)
+        steps.append(time.perf_counter() - start)
+    steps.sort()
+
+    span = MINIMAP_SIZE // MINIMAP_CELL_PIXELS
+    start = time.perf_counter()
+    for cell_x, cell_y in path[:200]:
+        for y in range(cell_y - span // 2, cell_y + span // 2):
+            for x in range(cell_x - span // 2, cell_x + span // 2):
+                if minimap.is_explored(x, y):
+                    target.fill(MINIMAP_PALETTE[minimap.cell_color(x, y)], (x, y, MINIMAP_CELL_PIXELS, MINIMAP_CELL_PIXELS))
+    naive = (time.perf_counter() - start) / min(200, len(path))
+
+    # Everything within reach of the path, worked out directly
+    expected = {(x + dx, y + dy) for x, y in path for dx, dy in minimap.offsets
+                if 0 <= x + dx < size and 0 <= y + dy < size}
+    same = minimap.revealed == len(expected) and all(minimap.is_explored(x, y) for x, y in expected)
+    print(f"minimap {size}x{size}: {len(path)} steps, {minimap.revealed} cells revealed   "
+          f"step p50 {percentile(steps, 0.5) * 1e6:6.1f} us   p99 {percentile(steps, 0.99) * 1e6:6.1f} us   "
+          f"window from grid {naive * 1e6:8.1f} us   memory {minimap.nbytes() / 1e3:7.1f} KB   "
+          f"{'ok' if same else 'MISMATCH'}")
+    return 0 if same else 1  # For sys.exit()
+
+# Enemies and pickups. Entities are bucketed by the CELL_SIZE cell under their center,
+# so proximity and overlap queries only visit the buckets around the area asked about.
+# Moving entities near the camera are stepped every simulation step; the rest are split
+# into ENTITY_FAR_TICKS round-robin groups and each group catches up when its turn comes.
+ENTITY_SIZE = 32
+ENEMY_SPEED = 2
+ENTITY_ACTIVE_MARGIN = 2  # Cells beyond the screen edge that still update at full rate
+ENTITY_FAR_TICKS = 16  # Distant entities move once every this many steps
+ENTITY_COUNTS = {'enemy': 1 / 40, 'coin': 1 / 20}  # Per floor cell of a generated maze, plus one key
+ENTITY_MAX = 10000
+ENTITY_COLORS = {'enemy': (200, 30, 30), 'key': (240, 200, 40), 'coin': (250, 230, 120)}
+ENTITY_MODE = False  # Populate games with entities; off until keys and pickups do something
+
+class Entity:
+    __slots__ = ('kind', 'x', 'y', 'previous_x', 'previous_y', 'cell', 'target', 'came_from', 'last_step', 'alive')
+
+    def __init__(self, kind, x, y):
+        self.kind = kind
+        self.x, self.y = x, y  # Center in world pixels
+        self.previous_x, self.previous_y = x, y
+        self.cell = None  # Spatial hash bucket
+        self.target = self.came_from = None  # Cells an enemy walks between
+        self.last_step = 0
+        self.alive = True
+
+    def overlaps(self, left, top, width, height):
+        half = ENTITY_SIZE / 2
+        return (self.x - half < left + width and left < self.x + half and
+                self.y - half < top + height and top < self.y + half)
+
+class SpatialHash:
+    # Buckets keyed by grid cell; each bucket is a dict used as an ordered set
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def key(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, entity):
+        entity.cell = self.key(entity.x, entity.y)
+        bucket = self.buckets.get(entity.cell)
+        if bucket is None:
+            bucket = self.buckets[entity.cell] = {}
+        bucket[entity] = None
+
+    def remove(self, entity):
+        bucket = self.buckets[entity.cell]
+        del bucket[entity]
+        if not bucket:
+            del self.buckets[entity.cell]
+
+    def moved(self, entity):
+        if self.key(entity.x, entity.y) != entity.cell:
+            self.remove(entity)
+            self.insert(entity)
+
+    def query(self, left, top, width, height):
+        # Entities whose centers fall in a bucket the rect touches
+        first_x, first_y = self.key(left, top)
+        last_x, last_y = self.key(left + width, top + height)
+        buckets = self.buckets
+        found = []
+        for cell_y in range(first_y, last_y + 1):
+            for cell_x in range(first_x, last_x + 1):
+                bucket = buckets.get((cell_x, cell_y))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def overlapping(self, left, top, width, height):
+        half = ENTITY_SIZE / 2
+        return [entity for entity in self.query(left - half, top - half, width + ENTITY_SIZE, height + ENTITY_SIZE)
+                if entity.overlaps(left, top, width, height)]
+
+    def near(self, x, y, radius):
+        limit = radius * radius
+        return [entity for entity in self.query(x - radius, y - radius, 2 * radius, 2 * radius)
+                if (entity.x - x) ** 2 + (entity.y - y) ** 2 <= limit]
+
+def cell_center(cell):
+    return cell[0] * CELL_SIZE + CELL_SIZE // 2, cell[1] * CELL_SIZE + CELL_SIZE // 2
+
+class EntityWorld:
+    def __init__(self, maze, seed=None):
+        self.maze = maze
+        self.grid = SpatialHash()
+        self.rng = random.Random(random.randrange(2 ** 32) if seed is None else seed)
+        self.groups = [[] for _ in range(ENTITY_FAR_TICKS)]  # Moving entities, round-robin
+        self.steps = 0
+        self.count = 0
+        self.collected = dict.fromkeys(ENTITY_COLORS, 0)
+        self.sprites = {}
+        self.updates = 0  # Entity updates done, for the benchmark
+
+    def spawn(self, kind, cell_x, cell_y):
+        entity = Entity(kind, *cell_center((cell_x, cell_y)))
+        entity.last_step = self.steps
+        self.grid.insert(entity)
+        if kind == 'enemy':
+            entity.came_from = entity.target = (cell_x, cell_y)
+            self.groups[self.count % ENTITY_FAR_TICKS].append(entity)
+        self.count += 1
+        return entity
+
+    def remove(self, entity):
+        entity.alive = False
+        self.grid.remove(entity)
+        self.count -= 1
+        if entity.kind == 'enemy':
+            for group in self.groups:
+                if entity in group:
+                    group.remove(entity)
+
+    def populate(self, counts=None):
+        # Random floor cells, found by sampling so huge mazes are not scanned
+        maze = self.maze
+        if maze.width is None:
+            return  # Endless mazes have no population yet
+        if counts is None:
+            floor = maze.width * maze.height // 2
+            counts = {kind: int(floor * share) for kind, share in ENTITY_COUNTS.items()}
+            counts['key'] = 1
+        for kind, count in counts.items():
+            for _ in range(min(count, ENTITY_MAX - self.count)):
+                while True:
+                    cell = (self.rng.randrange(1, maze.width - 1), self.rng.randrange(1, maze.height - 1))
+                    if not maze.is_wall_cell(*cell) and cell != (1, 1) and cell != maze.exit:
+                        break
+                self.spawn(kind, *cell)
+
+    def next_cell(self, enemy):
+        # Any open neighbour but the way back, unless it is a dead end
+        x, y = enemy.target
+        options = [cell for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                   if cell != enemy.came_from and not self.maze.is_wall_cell(*cell)]
+        return self.rng.choice(options) if options else enemy.came_from
+
+    def turn_around(self, enemy):
+        enemy.target, enemy.came_from = enemy.came_from, enemy.target
+
+    def heading_towards(self, enemy, x, y):
+        target_x, target_y = cell_center(enemy.target)
+        return (target_x - enemy.x) * (x - enemy.x) + (target_y - enemy.y) * (y - enemy.y) > 0
+
+    def advance(self, enemy):
+        # Walks cell center to cell center, covering every step since the last update
+        distance = ENEMY_SPEED * (self.steps - enemy.last_step)
+        enemy.last_step = self.steps
+        x, y = enemy.previous_x, enemy.previous_y = enemy.x, enemy.y
+        half = CELL_SIZE // 2
+        while True:
+            target_x, target_y = enemy.target[0] * CELL_SIZE + half, enemy.target[1] * CELL_SIZE + half
+            gap = abs(target_x - x) + abs(target_y - y)
+            if gap > distance:
+                break
+            x, y = target_x, target_y
+            distance -= gap
+            enemy.came_from, enemy.target = enemy.target, self.next_cell(enemy)
+        # Corridors are one cell wide, so the enemy heads along one axis only
+        heading_x = (target_x > x) - (target_x < x)
+        heading_y = (target_y > y) - (target_y < y)
+        enemy.x, enemy.y = x + heading_x * distance, y + heading_y * distance
+        self.grid.moved(enemy)
+        self.updates += 1
+
+        # Enemies that run into each other back off. Only ones ahead count, and those
+        # are in this bucket or the next one along the way.
+        buckets = self.grid.buckets
+        ahead = self.grid.key(enemy.x + heading_x * ENTITY_SIZE, enemy.y + heading_y * ENTITY_SIZE)
+        for key in (enemy.cell, ahead) if ahead != enemy.cell else (enemy.cell,):
+            for other in buckets.get(key, ()):
+                if (other is not enemy and other.kind == 'enemy' and abs(other.x - enemy.x) < ENTITY_SIZE and
+                        abs(other.y - enemy.y) < ENTITY_SIZE and
+                        (other.x - enemy.x) * heading_x + (other.y - enemy.y) * heading_y > 0):
+                    self.turn_around(enemy)
+                    return
+
+    def step(self, camera_x, camera_y):
+        # One simulation step: everything around the camera, then this step's share of the rest
+        self.steps += 1
+        margin = ENTITY_ACTIVE_MARGIN * CELL_SIZE
+        for entity in self.grid.query(camera_x - margin, camera_y - margin, WIDTH + 2 * margin, HEIGHT + 2 * margin):
+            if entity.kind == 'enemy' and entity.last_step != self.steps:
+                self.advance(entity)
+        for entity in self.groups[self.steps % ENTITY_FAR_TICKS]:
+            if entity.last_step != self.steps:
+                self.advance(entity)
+
+    def interact(self, player):
+        # Pickups touched by the player are collected, enemies block them
+        box = player.collision_border
+        center_x, center_y = box.centerx, box.centery
+        for entity in self.grid.overlapping(box.x, box.y, box.width, box.height):
+            if entity.kind == 'enemy':
+                player.x, player.y = player.previous_x, player.previous_y
+                player.collision_border.topleft = (player.x + player.collision_offset_x, player.y + player.collision_offset_y)
+                if self.heading_towards(entity, center_x, center_y):
+                    self.turn_around(entity)
+            else:
+                self.collected[entity.kind] += 1
+                self.remove(entity)
+
+    def visible(self, camera_x, camera_y, alpha=1.0):
+        # (entity, screen rect) for everything on screen, at interpolated positions
+        visible = []
+        for entity in self.grid.query(camera_x - ENTITY_SIZE, camera_y - ENTITY_SIZE,
+                                      WIDTH + 2 * ENTITY_SIZE, HEIGHT + 2 * ENTITY_SIZE):
+            x = entity.previous_x + (entity.x - entity.previous_x) * alpha
+            y = entity.previous_y + (entity.y - entity.previous_y) * alpha
+            visible.append((entity, pygame.Rect(round(x - camera_x) - ENTITY_SIZE // 2,
+                                                round(y - camera_y) - ENTITY_SIZE // 2, ENTITY_SIZE, ENTITY_SIZE)))
+        return visible
+
+    def sprite(self, kind, size):
+        sprite = self.sprites.get((kind, size))
+        if sprite is None:
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            color = ENTITY_COLORS[kind]
+            if kind == 'enemy':
+                pygame.draw.circle(sprite, color, (size // 2, size // 2), size // 2)
+            elif kind == 'key':
+                pygame.draw.rect(sprite, color, (size // 4, size // 3, size // 2, size // 3))
+            else:
+                pygame.draw.circle(sprite, color, (size // 2, size // 2), size // 4)
+            self.sprites[(kind, size)] = sprite
+        return sprite
+
+    def draw(self, visible, view=None):
+        view = view or scene_view(1.0)
+        size = view.to_view(ENTITY_SIZE)
+        view.surface.blits([(self.sprite(entity.kind, size), (view.to_view(rect.x), view.to_view(rect.y)))
+                            for entity, rect in visible], doreturn=False)
+
+def benchmark_entities(count=ENTITY_MAX, steps=600, size=501, seed=1):
+    # 10k enemies roaming a large maze, with the camera following a walk along the solution.
+    # Returns 1 if the spatial hash lost track of an entity, for sys.exit()
+    maze = Maze(size, size, seed=seed)
+    path = find_path(maze, (1, 1), maze.exit)
+    world = EntityWorld(maze, seed=seed)
+    world.populate({'enemy': count})
+
+    samples = []
+    for i in range(steps):
+        camera_x, camera_y = cell_center(path[i * len(path) // steps])
+        start = time.perf_counter()
+        world.step(camera_x - WIDTH // 2, camera_y - HEIGHT // 2)
+        world.grid.overlapping(camera_x - 15, camera_y - 22, 30, 45)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    # Everything still where the hash says, nobody inside a wall
+    misplaced = sum(world.grid.key(entity.x, entity.y) != entity.cell or maze.is_wall(int(entity.x), int(entity.y))
+                    for bucket in world.grid.buckets.values() for entity in bucket)
+    near_queries = time.perf_counter()
+    for cell in path[:1000]:
+        world.grid.near(*cell_center(cell), 3 * CELL_SIZE)
+    near_queries = (time.perf_counter() - near_queries) / min(1000, len(path))
+    print(f"entities {count} in {size}x{size}: step p50 {percentile(samples, 0.5) * 1e3:6.2f} ms   "
+          f"p99 {percentile(samples, 0.99) * 1e3:6.2f} ms   {world.updates / steps:7.1f} updates/step   "
+          f"near query {near_queries * 1e6:6.1f} us   {'ok' if misplaced == 0 else f'MISMATCH {misplaced}'}")
+
+    # The same population with every entity stepped every step, for comparison
+    start = time.perf_counter()
+    for _ in range(20):
+        world.steps += 1
+        for group in world.groups:
+            for entity in group:
+                world.advance(entity)
+    print(f"entities {count} all at full rate: {(time.perf_counter() - start) / 20 * 1e3:6.2f} ms/step")
+    return 1 if misplaced else 0
+
+def asset_report():
+    # Loads everything the game uses, then prints what each asset cost
+    assets.image('mainmenu.png', alpha=False)
+    assets.preload(PRELOAD_IMAGES, PRELOAD_SOUNDS)
+    assets.wait()
+    for name in PLAYER_SPRITE_FILES:
+        assets.image(name, size=(PLAYER_SIZE, PLAYER_SIZE))
+    for name in ('wall.png', 'floor.png'):
+        tile_texture(name, CELL_SIZE)
+    assets.image('optionmenu.png', alpha=False)
+
+    rows = sorted(assets.report(), key=lambda row: -row[3])
+    for label, kind, load_ms, resident in rows:
+        print(f"{label:<36} {kind:<6} {load_ms:8.2f} ms {resident / 1024:10.1f} KB")
+    print(f"{'total':<36} {'':<6} {sum(row[2] for row in rows):8.2f} ms {sum(row[3] for row in rows) / 1024:10.1f} KB")
+
+# Set by --exit-after-first-frame, used by benchmark_startup()
+exit_after_first_frame = False
+
+def report_startup_and_quit():
+    print(f"first_frame {time.time()}", flush=True)
+    assets.wait()
+    print(f"assets_ready {time.time()}", flush=True)
+    pygame.quit()
+
+def benchmark_startup(runs=5):
+    # Every run is a fresh interpreter so nothing is cached between them
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('SDL_AUDIODRIVER', 'dummy')
+    script = os.path.abspath(__file__)
+    directory = os.path.dirname(script)
+    import_code = "import time; start = time.perf_counter(); import amazed; print(time.perf_counter() - start)"
+
+    timings = {'import': [], 'first frame': [], 'assets ready': []}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', import_code], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True)
+        timings['import'].append(float(result.stdout.split()[-1]))
+
+        start = time.time()
+        result = subprocess.run([sys.executable, script, '--exit-after-first-frame'], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True)
+        marks = dict(line.split() for line in result.stdout.splitlines() if line.startswith(('first_frame', 'assets_ready')))
+        timings['first frame'].append(float(marks['first_frame']) - start)
+        timings['assets ready'].append(float(marks['assets_ready']) - start)
+
+    for name, samples in timings.items():
+        samples.sort()
+        print(f"startup {name:<13} median {percentile(samples, 0.5) * 1000:8.1f} ms   worst {samples[-1] * 1000:8.1f} ms")
+    print("(first frame and assets ready are measured from process launch)")
+
+class HeldKeys:
+    # Stands in for pygame.key.get_pressed() when driving the player without a keyboard
+    def __init__(self, *held):
+        self.held = set(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+def percentile(sorted_samples, fraction):
+    # Linear interpolation between the closest ranks
+    position = (len(sorted_samples) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+BENCHMARK_MIN_SAMPLE = 0.001  # Seconds; fast calls are batched until a sample takes this long
+BENCHMARK_NOISE_FLOOR_MS = 0.02  # Median slowdowns below this are never flagged
+BENCHMARK_SUITE_RUNS = 3  # Fresh processes per suite run, the best result of each benchmark is kept
+
+def time_samples(func, runs, calls=1, warmup=1):
+    # Seconds per call, one sample per batch of calls. Batches are grown to at least
+    # BENCHMARK_MIN_SAMPLE so timer resolution and scheduling jitter average out.
+    for _ in range(warmup):
+        func()
+    start = time.perf_counter()
+    func()
+    calls = max(calls, math.ceil(BENCHMARK_MIN_SAMPLE / max(time.perf_counter() - start, 1e-9)))
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        samples.append((time.perf_counter() - start) / calls)
+    return samples
+
+def summarize_samples(samples):
+    ordered = sorted(samples)
+    ms = 1000
+    return {
+        'runs': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * ms,
+        'min_ms': ordered[0] * ms,
+        'p50_ms': percentile(ordered, 0.50) * ms,
+        'p90_ms': percentile(ordered, 0.90) * ms,
+        'p99_ms': percentile(ordered, 0.99) * ms,
+        'max_ms': ordered[-1] * ms,
+    }
+
+BENCHMARK_CAMERAS = [(0, 0), (1500, 1200), (3000, 3000)]
+
+def run_benchmark_suite(seed=1):
+    global MAZE_RENDER_MODE
+    results = {}
+
+    for size, runs in ((25, 50), (101, 20), (501, 5)):
+        results[f'maze_init_{size}'] = time_samples(lambda: Maze(size, size, seed=seed), runs)
+
+    maze = Maze(101, 101, seed=seed)
+    render_mode = MAZE_RENDER_MODE
+    for mode in ('tiles', 'chunked'):
+        MAZE_RENDER_MODE = mode
+        for camera_x, camera_y in BENCHMARK_CAMERAS:
+            results[f'maze_draw_{mode}_{camera_x}_{camera_y}'] = time_samples(lambda: maze.draw(camera_x, camera_y), 100)
+    MAZE_RENDER_MODE = render_mode
+
+    results['fog_build'] = time_samples(fog_alpha, 10)
+    results['fog_cached'] = time_samples(create_light_map, 100, calls=100)
+    light_map = create_light_map()
+    results['fog_apply'] = time_samples(lambda: apply_light_map(screen, light_map), 100)
+
+    # The player zig-zags through the maze so some moves are blocked by walls
+    player = Player(CELL_SIZE + CELL_SIZE // 2 - PLAYER_SIZE // 2, CELL_SIZE + CELL_SIZE // 2 - PLAYER_SIZE // 2)
+    directions = [HeldKeys(controls['right']), HeldKeys(controls['down']), HeldKeys(controls['right'], controls['down']),
+                  HeldKeys(controls['left']), HeldKeys(controls['up'])]
+    step = [0]
+
+    def move_player():
+        step[0] += 1
+        player.move(directions[step[0] // 50 % len(directions)], maze)
+    results['player_move'] = time_samples(move_player, 100, calls=50)
+
+    # A crowded maze, stepped with the camera on the player
+    world = EntityWorld(Maze(501, 501, seed=seed), seed=seed)
+    world.populate({'enemy': ENTITY_MAX})
+    results['entities_step_10k'] = time_samples(lambda: world.step(0, 0), 50, calls=10)
+
+    # Keep the particle system at its cap for every update
+    particle_system = ParticleSystem()
 
+    def saturated_particles():
+        particle_system.emit(WIDTH // 2 - 100, HEIGHT // 2 - 25, 200, 50)
+        particle_system.update_and_draw(screen)
+    results['particles_update_and_draw'] = time_samples(saturated_particles, 200)
+
+    crowded_system = ParticleSystem(max_particles=10000)
+
+    def crowded_particles():
+        while crowded_system.engine.free() > 0:
+            crowded_system.emit(0, 0, WIDTH, HEIGHT)
+        crowded_system.update_and_draw(screen)
+    results['particles_update_and_draw_10k'] = time_samples(crowded_particles, 50)
+
+    # The whole game scene at each render quality, upscale included
+    camera_x, camera_y = player.x - WIDTH // 2 + PLAYER_SIZE // 2, player.y - HEIGHT // 2 + PLAYER_SIZE // 2
+    for name, scale in RENDER_QUALITY_PRESETS:
+        view = scene_view(scale)
+        light_map = create_light_map(scale)
+
+        def scene_frame():
+            view.surface.fill((255, 255, 255))
+            maze.draw(camera_x, camera_y, view)
+            player.draw(camera_x, camera_y, view)
+            apply_light_map(view.surface, light_map)
+            view.present()
+        results[f'scene_frame_{int(scale * 100)}'] = time_samples(scene_frame, 100)
+
+    return {name: summarize_samples(samples) for name, samples in results.items()}
+
+def write_benchmark_results(results, path):
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'numpy': np.__version__ if np is not None else None,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+def is_regression(summary, base, threshold):
+    # The best run and the median both slower than the baseline's by threshold, the median
+    # outside the baseline's own spread, and by more than the noise floor. The best run
+    # is what scheduling noise disturbs least.
+    return (summary['min_ms'] > base['min_ms'] * (1 + threshold) and
+            summary['p50_ms'] > base['p50_ms'] * (1 + threshold) and summary['p50_ms'] > base['p90_ms'] and
+            summary['p50_ms'] - base['p50_ms'] > BENCHMARK_NOISE_FLOOR_MS)
+
+def compare_benchmark_results(results, baseline_path, threshold, quiet=False):
+    # Returns the names whose median got slower than the baseline, see is_regression()
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, summary in sorted(results.items()):
+        if name not in baseline:
+            if not quiet:
+                print(f"{name:<34} {summary['p50_ms']:10.3f} ms   (new)")
+            continue
+        ratio = summary['p50_ms'] / max(baseline[name]['p50_ms'], 1e-9)
+        flag = ''
+        if is_regression(summary, baseline[name], threshold):
+            flag = 'REGRESSION'
+            regressions.append(name)
+        if quiet:
+            continue
+        print(f"{name:<34} {summary['p50_ms']:10.3f} ms   baseline {baseline[name]['p50_ms']:10.3f} ms   x{ratio:5.2f} {flag}")
+    return regressions
+
+def print_benchmark_results(results):
+    for name, summary in sorted(results.items()):
+        print(f"{name:<34} p50 {summary['p50_ms']:10.3f} ms   p90 {summary['p90_ms']:10.3f} ms   p99 {summary['p99_ms']:10.3f} ms")
+
+def run_benchmark_suite_process():
+    # The suite in a fresh interpreter. Some timings (maze generation, entities) shift
+    # for the whole life of a process, so repeats in one process are not independent.
+    script = os.path.abspath(__file__)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.json')
+        subprocess.run([sys.executable, script, '--benchmark-suite', '--suite-runs', '1', '--output', path],
+                       cwd=os.path.dirname(script), env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1'),
+                       capture_output=True, check=True)
+        with open(path) as f:
+            return json.load(f)['results']
+
+def keep_best_results(results, more):
+    for name, summary in more.items():
+        if name not in results or summary['p50_ms'] < results[name]['p50_ms']:
+            results[name] = summary
+
+def benchmark_suite(output, baseline=None, threshold=0.25, runs=BENCHMARK_SUITE_RUNS):
+    results = run_benchmark_suite()
+    for _ in range(runs - 1):
+        keep_best_results(results, run_benchmark_suite_process())
+    if baseline is not None and compare_benchmark_results(results, baseline, threshold, quiet=True):
+        # A slowdown has to survive another round of fresh runs
+        print("possible regressions, running the suite again to confirm")
+        for _ in range(max(runs, 1)):
+            keep_best_results(results, run_benchmark_suite_process())
+    write_benchmark_results(results, output)
+    if baseline is None:
+        print_benchmark_results(results)
+        return 0
+    regressions = compare_benchmark_results(results, baseline, threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
 
 
 def main():
+    init_display()
+    assets.preload(PRELOAD_IMAGES, PRELOAD_SOUNDS)
     particle_system = ParticleSystem()
     update_volume() 
 
     while True:
-        play_main_menu_music()
+        memory.cycle()
         choice = main_menu(particle_system)
         if choice == "play":
-            stop_main_menu_music()
-            play_random_game_music()
+            memory.enter('game')
+            music.play('game')
             maze_width = 25 
             maze_height = 25
-            fog = create_fog_of_war()
 
-            maze = Maze(maze_width, maze_height)
+            if ENDLESS_MODE:
+                maze = InfiniteMaze()
+            elif LEVEL_PATH is not None:
+                maze = load_maze(LEVEL_PATH)
+            else:
+                maze = Maze(maze_width, maze_height)
             player = Player(CELL_SIZE + CELL_SIZE // 2 - PLAYER_SIZE // 2, CELL_SIZE + CELL_SIZE // 2 - PLAYER_SIZE // 2)
+            presenter = FramePresenter()
+            minimap = Minimap(maze)
+            entities = None
+            if ENTITY_MODE:
+                entities = EntityWorld(maze)
+                entities.populate()
+            timestep = FixedTimestep()
+            last_time = time.perf_counter()
             
             paused = False
             running = True
             while running:
+                profiler.begin_frame()
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
+                        maze.close()
                         pygame.quit()
                         return
 
                     if event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_ESCAPE:
+                        if event.key == pygame.K_F3:
+                            profiler.toggle()
+                            profiler.begin_frame()
+                        elif event.key == pygame.K_TAB:
+                            minimap.enabled = not minimap.enabled
+                        elif event.key == pygame.K_ESCAPE:
                             if paused:
                                 paused = False
-                                play_random_game_music()
+                                music.unpause()
                             else:
                                 paused = True
-                                stop_game_music()
+                                music.pause()
                                 pause_choice = pause_menu()
+                                if pause_choice == "quit":
+                                    maze.close()
+                                    return
+                                presenter.invalidate()
+                                last_time = time.perf_counter()  # Time spent paused is not simulated
+                                profiler.begin_frame()  # Time spent paused is not part of the frame
                                 if pause_choice == "resume":
                                     paused = False
-                                    play_random_game_music()
+                                    music.unpause()
                                 elif pause_choice == "main_menu":
                                     running = False  # Exit the current game loop to return to main menu
                                     break  # Exit the event loop
-                
-                if not paused and not pygame.mixer.music.get_busy():
-                    play_random_game_music()
+                    elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                        presenter.invalidate()
+                    elif event.type == MUSIC_END_EVENT:
+                        music.track_ended()
+                profiler.mark('events')
+
+                music.update()
                 if not paused:
+                    # Fixed simulation steps for the real time since the last frame
+                    now = time.perf_counter()
+                    steps = timestep.advance(now - last_time)
+                    last_time = now
                     keys = pygame.key.get_pressed()
-                    player.move(keys, maze)
-
-                    # Check if player reached the exit
-                    if (int(player.x // CELL_SIZE), int(player.y // CELL_SIZE)) == maze.exit:
-                        running = False
+                    for _ in range(steps):
+                        player.move(keys, maze)
+                        if entities is not None:
+                            entities.step(player.x - WIDTH // 2 + PLAYER_SIZE // 2, player.y - HEIGHT // 2 + PLAYER_SIZE // 2)
+                            entities.interact(player)
+
+                        # Check if player reached the exit
+                        if maze.exit is not None and (int(player.x // CELL_SIZE), int(player.y // CELL_SIZE)) == maze.exit:
+                            running = False
+                            break
+                    player.interpolate(timestep.alpha())
+                    minimap.reveal_around(*player.center_cell())
 
                     # Calculate camera position to keep player centered
-                    camera_x = player.x - WIDTH // 2 + PLAYER_SIZE // 2
-                    camera_y = player.y - HEIGHT // 2 + PLAYER_SIZE // 2
-
-                    screen.fill((255, 255, 255))
-                    maze.draw(int(camera_x), int(camera_y))
-                    player.draw(int(camera_x), int(camera_y))
-                    
-                    # Apply fog of war
-                    screen.blit(fog, (0, 0))
-                    
-                    pygame.display.flip()
+                    camera_x = player.render_x - WIDTH // 2 + PLAYER_SIZE // 2
+                    camera_y = player.render_y - HEIGHT // 2 + PLAYER_SIZE // 2
+
+                    # The scene is drawn at the render quality picked in the options menu
+                    view = scene_view()
+                    light_map = create_light_map(view.scale)
+
+                    # Only what changed since the last presented frame is redrawn
+                    regions = {'player': (player.sprite_rect(int(camera_x), int(camera_y)),
+                                          (player.direction, int(player.animation_frame)))}
+                    if entities is not None:
+                        visible = entities.visible(int(camera_x), int(camera_y), timestep.alpha())
+                        for entity, rect in visible:
+                            regions[entity] = (rect, entity.kind)
+                    if minimap.enabled:
+                        regions['minimap'] = minimap.region()
+                    if profiler.enabled:
+                        regions['profiler'] = profiler.overlay_region()
+                    dirty_rects = presenter.dirty_rects((int(camera_x), int(camera_y), view.scale), regions)
+                    profiler.presented(dirty_rects)
+                    profiler.mark('update')
+
+                    for clip in [None] if dirty_rects is None else dirty_rects:
+                        view.surface.set_clip(None if clip is None else view.rect_to_view(clip))
+                        view.surface.fill((255, 255, 255))
+                        maze.draw(int(camera_x), int(camera_y), view)
+                        profiler.mark('maze')
+                        if entities is not None:
+                            entities.draw(visible, view)
+                            profiler.mark('entities')
+                        player.draw(int(camera_x), int(camera_y), view)
+                        profiler.mark('player')
+
+                        # Lighting and fog of war in one blit
+                        apply_light_map(view.surface, light_map)
+                        profiler.mark('fog')
+                        if view.offscreen is None:
+                            minimap.draw(screen)
+                            profiler.draw(screen)
+                            profiler.mark('overlay')
+                    view.surface.set_clip(None)
+
+                    if view.offscreen is not None and dirty_rects != []:
+                        # One upscale of the whole view; the overlay stays at full resolution
+                        view.present()
+                        minimap.draw(screen)
+                        profiler.draw(screen)
+                        profiler.mark('overlay')
+                        dirty_rects = None
+                    if dirty_rects is None:
+                        pygame.display.flip()
+                    elif dirty_rects:
+                        pygame.display.update(dirty_rects)
+                    profiler.mark('flip')
                     clock.tick(FPS)
-            stop_game_music()        
-            play_main_menu_music()
+                    profiler.mark('tick')
+                profiler.end_frame()
+                memory.frame()
+            music.stop()
+            maze.close()
         elif choice == "quit":
             pygame.quit()
             return
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Amazed")
+    parser.add_argument('--endless', action='store_true', help="play an endless chunked maze")
+    parser.add_argument('--entities', action='store_true', help="experimental: roaming enemies and pickups in the maze")
+    parser.add_argument('--level', metavar='PATH', help="play a maze saved with --save-level")
+    parser.add_argument('--save-level', metavar='PATH', help="generate a maze, save it and exit")
+    parser.add_argument('--level-size', type=int, default=25, help="cells per side for --save-level and --batch")
+    parser.add_argument('--level-seed', type=int, help="seed for --save-level (random by default) and --batch (0 by default)")
+    parser.add_argument('--level-generator', choices=sorted(MAZE_GENERATORS), default='backtracker',
+                        help="generator for --save-level and --batch")
+    parser.add_argument('--batch', type=int, metavar='COUNT', help="generate and score COUNT mazes in worker processes")
+    parser.add_argument('--batch-output', default='maze_batch.jsonl', help="JSON lines file --batch appends to and resumes from")
+    parser.add_argument('--workers', type=int, help="worker processes for --batch, one per core by default")
+    parser.add_argument('--solution-length', type=parse_band, metavar='MIN:MAX', help="keep mazes with a solution this long")
+    parser.add_argument('--dead-ends', type=parse_band, metavar='MIN:MAX', help="keep mazes with this many dead ends")
+    parser.add_argument('--branching', type=parse_band, metavar='MIN:MAX', help="keep mazes with this share of junctions")
+    parser.add_argument('--keep-dir', metavar='DIR', help="save kept mazes from --batch here as level files")
+    parser.add_argument('--benchmark-batch', action='store_true', help="time --batch with more workers and check resuming")
+    parser.add_argument('--benchmark-fog', action='store_true', help="compare fog mask build paths")
+    parser.add_argument('--benchmark-maze', action='store_true', help="report maze memory and generation time")
+    parser.add_argument('--benchmark-maze-files', action='store_true', help="round-trip saved mazes and time loading them")
+    parser.add_argument('--benchmark-generators', action='store_true', help="compare maze generators")
+    parser.add_argument('--benchmark-collision', action='store_true', help="compare collision resolvers")
+    parser.add_argument('--benchmark-timestep', action='store_true', help="check movement speed at different frame rates")
+    parser.add_argument('--benchmark-paths', action='store_true', help="time exit distance fields and path searches")
+    parser.add_argument('--benchmark-particles', action='store_true', help="time saturated particle updates")
+    parser.add_argument('--benchmark-entities', action='store_true', help="step 10k roaming entities on a large maze")
+    parser.add_argument('--benchmark-minimap', action='store_true', help="time minimap updates on a large maze")
+    parser.add_argument('--benchmark-menus', action='store_true', help="measure menu CPU use while idle")
+    parser.add_argument('--asset-report', action='store_true', help="print load time and memory per asset")
+    parser.add_argument('--benchmark-startup', action='store_true', help="time module import and time to first frame")
+    parser.add_argument('--exit-after-first-frame', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--benchmark-suite', action='store_true', help="time the hot paths headlessly and write JSON")
+    parser.add_argument('--output', default='benchmark_results.json', help="where --benchmark-suite writes its results")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against a saved --benchmark-suite result")
+    parser.add_argument('--suite-runs', type=int, default=BENCHMARK_SUITE_RUNS,
+                        help="fresh processes --benchmark-suite keeps the best result from")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed median slowdown before flagging, 0.25 = 25%%")
+    parser.add_argument('--fps', type=int, default=FPS, help="render frame rate cap, movement speed does not change")
+    parser.add_argument('--render-scale', type=float, default=RENDER_SCALE,
+                        help="internal render resolution of the maze view, 0.5 or 1.0 (also under Quality in Options); "
+                             "scales in between are allowed but usually slower than 1.0")
+    parser.add_argument('--profile', action='store_true', help="start with the F3 frame timing overlay on")
+    parser.add_argument('--memory', action='store_true', help="trace allocations and report them per scene")
+    parser.add_argument('--benchmark-memory', action='store_true',
+                        help="play menu/game cycles under --memory and fail on steady growth")
+    parser.add_argument('--profile-csv', metavar='PATH', help="record per-frame stage timings to a CSV file")
+    args = parser.parse_args()
+    if not 0 < args.render_scale <= 1:
+        parser.error("--render-scale must be above 0 and at most 1")
+    if args.level is not None:
+        # Opened here so a bad file is reported now, not after Play is clicked
+        try:
+            load_maze(args.level).close()
+        except (OSError, ValueError) as e:
+            parser.error(f"--level: {e}")
+
+    if args.benchmark_startup:
+        benchmark_startup()
+        sys.exit()
+    if args.batch is not None:
+        bands = {name: getattr(args, name) for name in ('solution_length', 'dead_ends', 'branching')
+                 if getattr(args, name) is not None}
+        try:
+            run_batch(args.batch, args.batch_output, args.level_size, args.level_size, args.level_generator,
+                      args.level_seed or 0, bands, args.keep_dir, args.workers)
+        except ValueError as e:
+            sys.exit(e)
+        except KeyboardInterrupt:
+            sys.exit(1)
+        sys.exit()
+    if args.benchmark_batch:
+        sys.exit(benchmark_batch())
+    if args.save_level:
+        save_maze(Maze(args.level_size, args.level_size, generator=args.level_generator, seed=args.level_seed), args.save_level)
+        sys.exit()
+    init_display()
+
+    if args.benchmark_fog:
+        sys.exit(benchmark_fog_of_war())
+    elif args.benchmark_maze:
+        benchmark_maze_sizes()
+    elif args.benchmark_maze_files:
+        sys.exit(benchmark_maze_files())
+    elif args.benchmark_generators:
+        sys.exit(benchmark_maze_generators())
+    elif args.benchmark_collision:
+        sys.exit(benchmark_collision())
+    elif args.benchmark_timestep:
+        sys.exit(benchmark_timestep())
+    elif args.benchmark_paths:
+        sys.exit(benchmark_paths())
+    elif args.benchmark_particles:
+        benchmark_particles()
+    elif args.benchmark_menus:
+        benchmark_menus()
+    elif args.benchmark_minimap:
+        sys.exit(benchmark_minimap())
+    elif args.benchmark_entities:
+        sys.exit(benchmark_entities())
+    elif args.asset_report:
+        asset_report()
+    elif args.benchmark_memory:
+        sys.exit(benchmark_memory())
+    elif args.benchmark_suite:
+        sys.exit(benchmark_suite(args.output, args.compare, args.threshold, args.suite_runs))
+    else:
+        ENDLESS_MODE = args.endless
+        ENTITY_MODE = args.entities
+        LEVEL_PATH = args.level
+        FPS = args.fps
+        RENDER_SCALE = args.render_scale
+        exit_after_first_frame = args.exit_after_first_frame
+        if args.profile_csv:
+            profiler.start_csv(args.profile_csv)
+        profiler.enabled = profiler.enabled or args.profile
+        if args.memory:
+            memory.start()
+        main()